@@ -1,13 +1,34 @@
+import functools
+import heapq
 import math
+import random
+
+try:
+    import numpy as np
+except ImportError:
+    # StaticTree2D needs numpy, Tree2D does not
+    np = None
 
 class Node2D:
+    __slots__ = ("key", "left", "right", "count", "dead", "deleted")
+    
     def __init__(self, p):
         self.key = p
         self.left = None
         self.right = None
+        # count is the number of live points in the subtree, dead the number
+        # of tombstoned ones
         self.count = 1
+        self.dead = 0
+        self.deleted = False
 
+# Points whose coordinate equals a node's split may be in either subtree,
+# as in StaticTree2D, so coincident points can be spread evenly instead of
+# forming a chain.
 class Tree2D:
+    # rebuild a subtree once more than this fraction of it is tombstones
+    DEAD_FRACTION = 0.5
+    
     def __init__(self):
         self.root = None
         
@@ -25,25 +46,95 @@ class Tree2D:
             return Node2D(p)
         
         if level % 2 == 0:
-            if p.y <= node.key.y:
-                node.left = self.__insert(node.left, level+1, p)
-                
-            else: # p.y > node.key.y
-                node.right = self.__insert(node.right, level+1, p)                
+            c, k = p.y, node.key.y
+        else:
+            c, k = p.x, node.key.x
+        
+        # a tie goes to the smaller side, so repeated points stay balanced
+        if c < k or (c == k and self.__size(node.left) <= self.__size(node.right)):
+            node.left = self.__insert(node.left, level+1, p)
             
         else:
-            if p.x <= node.key.x:
-                node.left = self.__insert(node.left, level+1, p)
-                
-            else: # p.x > node.key.x
-                node.right = self.__insert(node.right, level+1, p)
+            node.right = self.__insert(node.right, level+1, p)
                                 
-        node.count = 1 + self.__size(node.left) + self.__size(node.right)
+        node.count += 1
         return node
         
     def insert(self, p):
         self.root = self.__insert(self.root, 1, p)
         
+    def __partition(self, points, level):
+        # quickselect the median coordinate for this level and split the
+        # points around it; points equal to the median are shared between
+        # the sides so that each gets half
+        if level % 2 == 0:
+            coord = lambda p: p.y
+        else:
+            coord = lambda p: p.x
+        
+        k = len(points) // 2
+        left = []
+        right = []
+        while True:
+            pivot = coord(random.choice(points))
+            lo = [p for p in points if coord(p) < pivot]
+            eq = [p for p in points if coord(p) == pivot]
+            hi = [p for p in points if coord(p) > pivot]
+            
+            if k < len(lo):
+                right += eq
+                right += hi
+                points = lo
+            
+            elif k < len(lo) + len(eq):
+                i = k - len(lo)
+                median = eq[i]
+                left += lo
+                left += eq[:i]
+                right += eq[i+1:]
+                right += hi
+                return median, left, right
+            
+            else:
+                k -= len(lo) + len(eq)
+                left += lo
+                left += eq
+                points = hi
+        
+    def __build(self, points, level):
+        if not points:
+            return None
+        
+        median, left, right = self.__partition(points, level)
+        node = Node2D(median)
+        node.left = self.__build(left, level+1)
+        node.right = self.__build(right, level+1)
+        node.count = 1 + self.__size(node.left) + self.__size(node.right)
+        return node
+    
+    # @return : a balanced tree built from an iterable of points
+    @classmethod
+    def from_points(cls, points):
+        tree = cls()
+        tree.root = tree.__build(list(points), 1)
+        return tree
+    
+    # @return : generator over the live points in the subtree under node
+    def __points(self, node):
+        stack = [node] if node else []
+        while stack:
+            node = stack.pop()
+            if not node.deleted:
+                yield node.key
+            if node.right:
+                stack.append(node.right)
+            if node.left:
+                stack.append(node.left)
+    
+    # rebuild the tree in balanced form, e.g. after many inserts
+    def rebalance(self):
+        self.root = self.__build(list(self.__points(self.root)), 1)
+    
     def __contains(self, node, level, p):
         if not node:
             return None
@@ -56,10 +147,11 @@ class Tree2D:
                 return self.__contains(node.right, level+1, p)
             
             else:
-                if p.x == node.key.x:
+                if p.x == node.key.x and not node.deleted:
                     return node
                 else:
-                    return self.__contains(node.left, level+1, p)
+                    return self.__contains(node.left, level+1, p) \
+                        or self.__contains(node.right, level+1, p)
                 
         else:
             if p.x < node.key.x:
@@ -69,10 +161,11 @@ class Tree2D:
                 return self.__contains(node.right, level+1, p)
             
             else:
-                if p.y == node.key.y:
+                if p.y == node.key.y and not node.deleted:
                     return node
                 else:
-                    return self.__contains(node.left, level+1, p)
+                    return self.__contains(node.left, level+1, p) \
+                        or self.__contains(node.right, level+1, p)
         
     def contains(self, p):
         if not self.root:
@@ -80,72 +173,273 @@ class Tree2D:
         
         return self.__contains(self.root, 1, p) != None
     
-    def __range(self, node, level, r):
-        if not node:
-            return []
-        
-        x = []
-        if r.contains(node.key):
-            x.append(node.key)
+    # remove one point equal to p
+    # @return : True if a point was removed, otherwise False
+    def delete(self, p):
+        # find a live node holding p, remembering the path to it; on a tie
+        # with the split both subtrees have to be searched
+        path = None
+        stack = [(self.root, 1, ())]
+        while stack:
+            node, level, ancestors = stack.pop()
+            if not node:
+                continue
             
-        if level % 2 == 0:
-            if r.yMin <= node.key.y and r.yMax > node.key.y:
-                x += self.__range(node.left, level+1, r)
-                return x + self.__range(node.right, level+1, r)
+            if level % 2 == 0:
+                c, k = p.y, node.key.y
+            else:
+                c, k = p.x, node.key.x
+                
+            if c < k:
+                stack.append((node.left, level+1, ancestors + (node,)))
+            elif c > k:
+                stack.append((node.right, level+1, ancestors + (node,)))
+            elif p.x == node.key.x and p.y == node.key.y and not node.deleted:
+                path = list(ancestors) + [node]
+                break
+            else:
+                stack.append((node.right, level+1, ancestors + (node,)))
+                stack.append((node.left, level+1, ancestors + (node,)))
             
-            elif r.yMin <= node.key.y:
-                return x + self.__range(node.left, level+1, r)
+        if not path:
+            return False
+        
+        # the node stays in place as a tombstone so the tree shape, and
+        # every split below it, remains valid
+        node.deleted = True
+        for n in path:
+            n.count -= 1
+            n.dead += 1
+        
+        # scapegoat style cleanup: rebuild the highest subtree on the path
+        # that has become mostly tombstones
+        for i in range(len(path)):
+            n = path[i]
+            if n.dead > self.DEAD_FRACTION * (n.count + n.dead):
+                subtree = self.__build(list(self.__points(n)), i+1)
+                if i == 0:
+                    self.root = subtree
+                elif path[i-1].left is n:
+                    path[i-1].left = subtree
+                else:
+                    path[i-1].right = subtree
+                    
+                for a in path[:i]:
+                    a.dead -= n.dead
+                break
             
-            else:
-                return x + self.__range(node.right, level+1, r)
+        return True
+    
+    # @return : generator over the points inside r
+    def iter_range(self, r):
+        if not self.root:
+            return
+        
+        # explicit stack of (node, level) so degenerate trees cannot hit
+        # the recursion limit
+        stack = [(self.root, 1)]
+        while stack:
+            node, level = stack.pop()
+            key = node.key
             
-        else:
-            if r.xMin <= node.key.x and r.xMax > node.key.x:
-                x += self.__range(node.left, level+1, r)
-                return x + self.__range(node.right, level+1, r)
+            if not node.deleted and r.contains(key):
+                yield key
             
-            elif r.xMin <= node.key.x:
-                return x + self.__range(node.left, level+1, r)
+            if level % 2 == 0:
+                if r.yMax >= key.y and node.right:
+                    stack.append((node.right, level+1))
+                if r.yMin <= key.y and node.left:
+                    stack.append((node.left, level+1))
             
             else:
-                return x + self.__range(node.right, level+1, r)
+                if r.xMax >= key.x and node.right:
+                    stack.append((node.right, level+1))
+                if r.xMin <= key.x and node.left:
+                    stack.append((node.left, level+1))
         
     def range(self, r):
-        return self.__range(self.root, 1, r)
+        return list(self.iter_range(r))
+    
+    # @return : number of points inside r
+    def count_range(self, r):
+        if not self.root:
+            return 0
+        
+        total = 0
+        stack = [(self.root, 1, -math.inf, -math.inf, math.inf, math.inf)]
+        while stack:
+            node, level, xMin, yMin, xMax, yMax = stack.pop()
+            
+            if xMin >= r.xMin and xMax <= r.xMax and yMin >= r.yMin and yMax <= r.yMax:
+                # the whole subtree lies inside r
+                total += node.count
+                continue
+            
+            key = node.key
+            if not node.deleted and r.contains(key):
+                total += 1
+            
+            if level % 2 == 0:
+                if r.yMax >= key.y and node.right:
+                    stack.append((node.right, level+1, xMin, key.y, xMax, yMax))
+                if r.yMin <= key.y and node.left:
+                    stack.append((node.left, level+1, xMin, yMin, xMax, key.y))
+            
+            else:
+                if r.xMax >= key.x and node.right:
+                    stack.append((node.right, level+1, key.x, yMin, xMax, yMax))
+                if r.xMin <= key.x and node.left:
+                    stack.append((node.left, level+1, xMin, yMin, key.x, yMax))
+                    
+        return total
     
-    def __nearest(self, node, level, p):
+    def __regionDistanceSquared(self, p, xMin, yMin, xMax, yMax):
+        # squared distance from p to the region covered by a subtree
+        dx = 0
+        if p.x < xMin:
+            dx = xMin - p.x
+        elif p.x > xMax:
+            dx = p.x - xMax
+            
+        dy = 0
+        if p.y < yMin:
+            dy = yMin - p.y
+        elif p.y > yMax:
+            dy = p.y - yMax
+            
+        return dx*dx + dy*dy
+    
+    def __nearest(self, node, level, p, xMin, yMin, xMax, yMax, best):
         if not node:
-            return []
+            return
         
-        x = []
-        x.append([node.key.distanceTo(p),node.key])
+        if self.__regionDistanceSquared(p, xMin, yMin, xMax, yMax) >= best[0]:
+            # nothing in this subtree can beat the best point found so far
+            return
+        
+        if not node.deleted:
+            d = node.key.distanceSquaredTo(p)
+            if d < best[0]:
+                best[0] = d
+                best[1] = node.key
         
+        # visit the side of the splitting line containing p first
         if level % 2 == 0:
             if p.y <= node.key.y:
-                return x + self.__nearest(node.left, level+1, p)
-            
-            elif p.y > node.key.y:
-                return x + self.__nearest(node.right, level+1, p)
+                self.__nearest(node.left, level+1, p, xMin, yMin, xMax, node.key.y, best)
+                self.__nearest(node.right, level+1, p, xMin, node.key.y, xMax, yMax, best)
+                
+            else: # p.y > node.key.y
+                self.__nearest(node.right, level+1, p, xMin, node.key.y, xMax, yMax, best)
+                self.__nearest(node.left, level+1, p, xMin, yMin, xMax, node.key.y, best)
         
         else:
             if p.x <= node.key.x:
-                return x + self.__nearest(node.left, level+1, p)
-            
-            elif p.x > node.key.x:
-                return x + self.__nearest(node.right, level+1, p)
+                self.__nearest(node.left, level+1, p, xMin, yMin, node.key.x, yMax, best)
+                self.__nearest(node.right, level+1, p, node.key.x, yMin, xMax, yMax, best)
+                
+            else: # p.x > node.key.x
+                self.__nearest(node.right, level+1, p, node.key.x, yMin, xMax, yMax, best)
+                self.__nearest(node.left, level+1, p, xMin, yMin, node.key.x, yMax, best)
     
     def nearest(self, p):
-        dist = self.__nearest(self.root, 1, p)
-        nearest = dist[0]
-        for i in range(1, len(dist)):
-            if dist[i][0] < nearest[0]:
-                nearest = dist[i]
-        return nearest[1]
+        if not self.root:
+            return None
+        
+        # best = [squared distance, point]
+        best = [math.inf, None]
+        self.__nearest(self.root, 1, p, -math.inf, -math.inf, math.inf, math.inf, best)
+        return best[1]
+    
+    def __knearest(self, node, level, p, k, xMin, yMin, xMax, yMax, heap):
+        if not node:
+            return
+        
+        # heap is a max-heap of the k best points, stored as
+        # [-squared distance, insertion order, point]
+        if len(heap) == k and self.__regionDistanceSquared(p, xMin, yMin, xMax, yMax) >= -heap[0][0]:
+            return
+        
+        if not node.deleted:
+            d = node.key.distanceSquaredTo(p)
+            if len(heap) < k:
+                heapq.heappush(heap, (-d, len(heap), node.key))
+            elif d < -heap[0][0]:
+                heapq.heapreplace(heap, (-d, heap[0][1], node.key))
+        
+        if level % 2 == 0:
+            if p.y <= node.key.y:
+                self.__knearest(node.left, level+1, p, k, xMin, yMin, xMax, node.key.y, heap)
+                self.__knearest(node.right, level+1, p, k, xMin, node.key.y, xMax, yMax, heap)
+                
+            else: # p.y > node.key.y
+                self.__knearest(node.right, level+1, p, k, xMin, node.key.y, xMax, yMax, heap)
+                self.__knearest(node.left, level+1, p, k, xMin, yMin, xMax, node.key.y, heap)
+        
+        else:
+            if p.x <= node.key.x:
+                self.__knearest(node.left, level+1, p, k, xMin, yMin, node.key.x, yMax, heap)
+                self.__knearest(node.right, level+1, p, k, node.key.x, yMin, xMax, yMax, heap)
+                
+            else: # p.x > node.key.x
+                self.__knearest(node.right, level+1, p, k, node.key.x, yMin, xMax, yMax, heap)
+                self.__knearest(node.left, level+1, p, k, xMin, yMin, node.key.x, yMax, heap)
+    
+    # @return : the k points closest to p, nearest first
+    def knearest(self, p, k):
+        if k <= 0:
+            return []
+        
+        heap = []
+        self.__knearest(self.root, 1, p, k, -math.inf, -math.inf, math.inf, math.inf, heap)
+        heap.sort(reverse=True)
+        return [item[2] for item in heap]
+    
+    def __within(self, node, level, p, r2, xMin, yMin, xMax, yMax, x):
+        if not node:
+            return
+        
+        if self.__regionDistanceSquared(p, xMin, yMin, xMax, yMax) > r2:
+            return
+        
+        if not node.deleted and node.key.distanceSquaredTo(p) <= r2:
+            x.append(node.key)
+        
+        if level % 2 == 0:
+            self.__within(node.left, level+1, p, r2, xMin, yMin, xMax, node.key.y, x)
+            self.__within(node.right, level+1, p, r2, xMin, node.key.y, xMax, yMax, x)
+        
+        else:
+            self.__within(node.left, level+1, p, r2, xMin, yMin, node.key.x, yMax, x)
+            self.__within(node.right, level+1, p, r2, node.key.x, yMin, xMax, yMax, x)
+    
+    # @return : all points at distance r or less from p
+    def within(self, p, r):
+        x = []
+        self.__within(self.root, 1, p, r*r, -math.inf, -math.inf, math.inf, math.inf, x)
+        return x
 
+# points are immutable and compare and hash like the tuple (x, y), so they
+# can be used as dict keys and sorted
+@functools.total_ordering
 class Point2D:
+    __slots__ = ("x", "y")
+    
     def __init__(self, x, y):
-        self.x = x
-        self.y = y
+        object.__setattr__(self, "x", x)
+        object.__setattr__(self, "y", y)
+    
+    def __setattr__(self, name, value):
+        # the hash depends on x and y, so changing them would corrupt any
+        # dict or set holding the point
+        raise AttributeError("Point2D is immutable")
+    
+    def __delattr__(self, name):
+        raise AttributeError("Point2D is immutable")
+    
+    def __reduce__(self):
+        # copy and pickle would otherwise restore the slots via setattr
+        return (Point2D, (self.x, self.y))
     
     def distanceTo(self, p):
         # use pythagorean theorm
@@ -154,10 +448,31 @@ class Point2D:
         z = math.sqrt(pow(dx,2)+pow(dy,2))
         return round(z,4)
     
+    def distanceSquaredTo(self, p):
+        # cheaper than distanceTo when only comparing distances
+        dx = self.x - p.x
+        dy = self.y - p.y
+        return dx*dx + dy*dy
+    
     def __str__(self):
         return '({0},{1})'.format(self.x,self.y)
     
+    def __eq__(self, p):
+        if not isinstance(p, Point2D):
+            return NotImplemented
+        return self.x == p.x and self.y == p.y
+    
+    def __lt__(self, p):
+        if not isinstance(p, Point2D):
+            return NotImplemented
+        return (self.x, self.y) < (p.x, p.y)
+    
+    def __hash__(self):
+        return hash((self.x, self.y))
+    
 class RectHV:
+    __slots__ = ("xMin", "yMin", "xMax", "yMax")
+    
     def __init__(self, xMin, yMin, xMax, yMax):
         self.xMin = xMin
         self.yMin = yMin
@@ -169,4 +484,298 @@ class RectHV:
             and p.y >= self.yMin and p.y <= self.yMax:
             return True
         
-        return False
\ No newline at end of file
+        return False
+
+# immutable 2d tree stored in flat numpy arrays
+#
+# The points are reordered in place so that the subtree covering positions
+# [lo, hi) has its splitting point at mid = (lo + hi) // 2, its left subtree
+# in [lo, mid) and its right subtree in [mid+1, hi). Children are therefore
+# implicit and no per-node objects exist. Ranges of LEAF_SIZE points or
+# fewer are leaves and are scanned with vectorized numpy operations.
+class StaticTree2D:
+    LEAF_SIZE = 32
+    
+    def __init__(self, xs, ys):
+        if np is None:
+            raise ImportError("StaticTree2D requires numpy")
+        
+        self.xs = np.array(xs, dtype=np.float64)
+        self.ys = np.array(ys, dtype=np.float64)
+        if self.xs.shape != self.ys.shape or self.xs.ndim != 1:
+            raise ValueError("xs and ys must be 1-d arrays of the same length")
+        
+        # position of each stored point in the input arrays
+        if len(self.xs) < 2**31:
+            self.index = np.arange(len(self.xs), dtype=np.int32)
+        else:
+            self.index = np.arange(len(self.xs), dtype=np.int64)
+        
+        self.__build(0, len(self.xs), 1)
+        
+    # @return : a tree built from an iterable of Point2D
+    @classmethod
+    def from_points(cls, points):
+        points = list(points)
+        return cls([p.x for p in points], [p.y for p in points])
+    
+    def __build(self, lo, hi, level):
+        if hi - lo <= self.LEAF_SIZE:
+            return
+        
+        mid = (lo + hi) // 2
+        if level % 2 == 0:
+            coord = self.ys
+        else:
+            coord = self.xs
+        
+        # selection rather than a sort: everything in [lo, mid) is <= the
+        # split and everything in (mid, hi) is >= it
+        order = np.argpartition(coord[lo:hi], mid - lo) + lo
+        self.xs[lo:hi] = self.xs[order]
+        self.ys[lo:hi] = self.ys[order]
+        self.index[lo:hi] = self.index[order]
+        
+        self.__build(lo, mid, level+1)
+        self.__build(mid+1, hi, level+1)
+        
+    def size(self):
+        return len(self.xs)
+    
+    def __point(self, i):
+        return Point2D(float(self.xs[i]), float(self.ys[i]))
+    
+    def contains(self, p):
+        stack = [(0, len(self.xs), 1)]
+        while stack:
+            lo, hi, level = stack.pop()
+            
+            if hi - lo <= self.LEAF_SIZE:
+                if np.any((self.xs[lo:hi] == p.x) & (self.ys[lo:hi] == p.y)):
+                    return True
+                continue
+            
+            mid = (lo + hi) // 2
+            if self.xs[mid] == p.x and self.ys[mid] == p.y:
+                return True
+            
+            if level % 2 == 0:
+                c, split = p.y, self.ys[mid]
+            else:
+                c, split = p.x, self.xs[mid]
+            
+            # points equal to the split may be on either side
+            if c <= split:
+                stack.append((lo, mid, level+1))
+            if c >= split:
+                stack.append((mid+1, hi, level+1))
+                
+        return False
+    
+    # @return : positions of the points inside r
+    def __range(self, r):
+        found = []
+        stack = [(0, len(self.xs), 1)]
+        while stack:
+            lo, hi, level = stack.pop()
+            
+            if hi - lo <= self.LEAF_SIZE:
+                xs = self.xs[lo:hi]
+                ys = self.ys[lo:hi]
+                mask = (xs >= r.xMin) & (xs <= r.xMax) & (ys >= r.yMin) & (ys <= r.yMax)
+                found.append(np.flatnonzero(mask) + lo)
+                continue
+            
+            mid = (lo + hi) // 2
+            x = self.xs[mid]
+            y = self.ys[mid]
+            if r.xMin <= x <= r.xMax and r.yMin <= y <= r.yMax:
+                found.append(np.array([mid]))
+            
+            if level % 2 == 0:
+                cMin, cMax, split = r.yMin, r.yMax, y
+            else:
+                cMin, cMax, split = r.xMin, r.xMax, x
+            
+            if cMin <= split:
+                stack.append((lo, mid, level+1))
+            if cMax >= split:
+                stack.append((mid+1, hi, level+1))
+        
+        if not found:
+            return np.empty(0, dtype=np.intp)
+        return np.concatenate(found)
+    
+    def range(self, r):
+        return [self.__point(i) for i in self.__range(r)]
+    
+    # @return : position of the point closest to (px, py), or -1
+    def __nearest(self, px, py):
+        best = -1
+        bestDist = math.inf
+        
+        # stack of (lo, hi, level, lower bound on the squared distance)
+        stack = [(0, len(self.xs), 1, 0.0)]
+        while stack:
+            lo, hi, level, bound = stack.pop()
+            if bound >= bestDist:
+                continue
+            
+            if hi - lo <= self.LEAF_SIZE:
+                if hi > lo:
+                    dx = self.xs[lo:hi] - px
+                    dy = self.ys[lo:hi] - py
+                    d = dx*dx + dy*dy
+                    i = int(np.argmin(d))
+                    if d[i] < bestDist:
+                        bestDist = float(d[i])
+                        best = lo + i
+                continue
+            
+            mid = (lo + hi) // 2
+            x = float(self.xs[mid])
+            y = float(self.ys[mid])
+            d = (x - px)*(x - px) + (y - py)*(y - py)
+            if d < bestDist:
+                bestDist = d
+                best = mid
+            
+            if level % 2 == 0:
+                diff = py - y
+            else:
+                diff = px - x
+            
+            # push the far side first so the near side is searched first
+            farBound = max(bound, diff*diff)
+            if diff <= 0:
+                stack.append((mid+1, hi, level+1, farBound))
+                stack.append((lo, mid, level+1, bound))
+            else:
+                stack.append((lo, mid, level+1, farBound))
+                stack.append((mid+1, hi, level+1, bound))
+                
+        return best
+    
+    def nearest(self, p):
+        i = self.__nearest(p.x, p.y)
+        if i < 0:
+            return None
+        
+        return self.__point(i)
+    
+    # @return : for each probe (xs[i], ys[i]) the input index of the nearest
+    #           point, or -1 if the tree is empty
+    def nearest_many(self, xs, ys):
+        qx = np.asarray(xs, dtype=np.float64)
+        qy = np.asarray(ys, dtype=np.float64)
+        if qx.shape != qy.shape or qx.ndim != 1:
+            raise ValueError("xs and ys must be 1-d arrays of the same length")
+        
+        best = np.full(len(qx), np.inf)
+        bestPos = np.full(len(qx), -1, dtype=np.intp)
+        if len(self.xs) == 0:
+            return bestPos
+        
+        # all probes walk the tree together; each task carries the probes
+        # still interested in a subtree and a lower bound on their squared
+        # distance to it
+        stack = [(0, len(self.xs), 1, np.arange(len(qx)), np.zeros(len(qx)))]
+        while stack:
+            lo, hi, level, q, bound = stack.pop()
+            keep = bound < best[q]
+            if not keep.all():
+                q = q[keep]
+                bound = bound[keep]
+            if len(q) == 0:
+                continue
+            
+            px = qx[q]
+            py = qy[q]
+            
+            if hi - lo <= self.LEAF_SIZE:
+                dx = self.xs[lo:hi] - px[:, None]
+                dy = self.ys[lo:hi] - py[:, None]
+                d = dx*dx + dy*dy
+                j = np.argmin(d, axis=1)
+                d = d[np.arange(len(q)), j]
+                better = d < best[q]
+                best[q[better]] = d[better]
+                bestPos[q[better]] = lo + j[better]
+                continue
+            
+            mid = (lo + hi) // 2
+            x = self.xs[mid]
+            y = self.ys[mid]
+            d = (px - x)*(px - x) + (py - y)*(py - y)
+            better = d < best[q]
+            best[q[better]] = d[better]
+            bestPos[q[better]] = mid
+            
+            if level % 2 == 0:
+                diff = py - y
+            else:
+                diff = px - x
+            
+            # far sides are pushed first so that every probe has searched
+            # its near side, and tightened its best distance, before they
+            # are pruned
+            farBound = np.maximum(bound, diff*diff)
+            left = diff <= 0
+            right = ~left
+            stack.append((mid+1, hi, level+1, q[left], farBound[left]))
+            stack.append((lo, mid, level+1, q[right], farBound[right]))
+            stack.append((lo, mid, level+1, q[left], bound[left]))
+            stack.append((mid+1, hi, level+1, q[right], bound[right]))
+            
+        return self.index[bestPos]
+    
+    # @param rects : sequence of RectHV, or array of rows (xMin, yMin, xMax, yMax)
+    # @return : for each rectangle an array of the input indices inside it
+    def range_many(self, rects):
+        if len(rects) and isinstance(rects[0], RectHV):
+            rects = [(r.xMin, r.yMin, r.xMax, r.yMax) for r in rects]
+        bounds = np.asarray(rects, dtype=np.float64).reshape(-1, 4)
+        xMin, yMin, xMax, yMax = bounds.T
+        
+        hitQuery = []
+        hitPos = []
+        stack = [(0, len(self.xs), 1, np.arange(len(bounds)))]
+        while stack:
+            lo, hi, level, q = stack.pop()
+            if len(q) == 0 or hi == lo:
+                continue
+            
+            if hi - lo <= self.LEAF_SIZE:
+                xs = self.xs[lo:hi]
+                ys = self.ys[lo:hi]
+                mask = (xs >= xMin[q, None]) & (xs <= xMax[q, None]) \
+                    & (ys >= yMin[q, None]) & (ys <= yMax[q, None])
+                rows, cols = np.nonzero(mask)
+                hitQuery.append(q[rows])
+                hitPos.append(lo + cols)
+                continue
+            
+            mid = (lo + hi) // 2
+            x = self.xs[mid]
+            y = self.ys[mid]
+            inside = (x >= xMin[q]) & (x <= xMax[q]) & (y >= yMin[q]) & (y <= yMax[q])
+            hitQuery.append(q[inside])
+            hitPos.append(np.full(np.count_nonzero(inside), mid))
+            
+            if level % 2 == 0:
+                cMin, cMax, split = yMin[q], yMax[q], y
+            else:
+                cMin, cMax, split = xMin[q], xMax[q], x
+            
+            stack.append((lo, mid, level+1, q[cMin <= split]))
+            stack.append((mid+1, hi, level+1, q[cMax >= split]))
+        
+        if not hitQuery:
+            return [np.empty(0, dtype=self.index.dtype) for i in range(len(bounds))]
+        
+        # group the hits by rectangle
+        hitQuery = np.concatenate(hitQuery)
+        hitPos = np.concatenate(hitPos)
+        order = np.argsort(hitQuery, kind="stable")
+        splits = np.searchsorted(hitQuery[order], np.arange(1, len(bounds)))
+        return np.split(self.index[hitPos[order]], splits)
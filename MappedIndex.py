@@ -0,0 +1,177 @@
+# read-only ordered index stored in a memory-mapped file
+#
+# The file holds a small header followed by fixed size (key, val) records in
+# increasing key order, written from the in-order iterator of an RBTree (or
+# anything else with an items() method yielding sorted pairs). Lookups binary
+# search the mapped records, so opening an index costs no deserialization
+# and only the pages touched by a query are read in by the OS.
+#
+# Keys and values are packed with struct format codes, e.g. "q" for a 64 bit
+# integer, "d" for a double or "16s" for 16 bytes. Note that "s" fields come
+# back padded with NUL bytes to their full width.
+from bisect import bisect_left, bisect_right
+import mmap
+import struct
+
+MAGIC = b"RBIX"
+VERSION = 1
+HEADER = struct.Struct("<4sHxxQ16s16s")
+
+# @return : number of struct fields a key or value format packs
+def field_count(format):
+    packer = struct.Struct("<" + format)
+    return len(packer.unpack(bytes(packer.size)))
+
+# @param tree : object whose items() yields (key, val) in increasing key order
+# @return : number of records written
+def write_index(path, tree, keyFormat="q", valFormat="q"):
+    record = struct.Struct("<" + keyFormat + valFormat)
+    multiKey = field_count(keyFormat) > 1
+    multiVal = field_count(valFormat) > 1
+    count = 0
+
+    with open(path, "wb") as f:
+        # the record count is filled in once every record has been written
+        f.write(HEADER.pack(MAGIC, VERSION, 0, keyFormat.encode(), valFormat.encode()))
+
+        prev = None
+        for key, val in tree.items():
+            if count and not prev < key:
+                raise ValueError("keys must be strictly increasing")
+
+            fields = (tuple(key) if multiKey else (key,)) + (tuple(val) if multiVal else (val,))
+            f.write(record.pack(*fields))
+            prev = key
+            count += 1
+
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, count, keyFormat.encode(), valFormat.encode()))
+
+    return count
+
+class MappedIndex:
+    # sequence view over the keys so bisect can search the file directly
+    class KeyView:
+        def __init__(self, index):
+            self.index = index
+
+        def __len__(self):
+            return self.index.count
+
+        def __getitem__(self, i):
+            return self.index.record(i)[0]
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, count, keyFormat, valFormat = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError("{} is not an index file".format(path))
+
+        keyFormat = keyFormat.rstrip(b"\0").decode()
+        valFormat = valFormat.rstrip(b"\0").decode()
+        self.keyFields = field_count(keyFormat)
+        self.recordStruct = struct.Struct("<" + keyFormat + valFormat)
+        self.count = count
+        self.keyView = self.KeyView(self)
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # @return : (key, val) stored at position i
+    def record(self, i):
+        fields = self.recordStruct.unpack_from(self.map, HEADER.size + i * self.recordStruct.size)
+        if self.keyFields == 1 and len(fields) == 2:
+            return fields
+
+        # multi-field formats come back flat, regroup into key and val
+        key = fields[:self.keyFields]
+        val = fields[self.keyFields:]
+        return (key[0] if len(key) == 1 else key), (val[0] if len(val) == 1 else val)
+
+    def size(self):
+        return self.count
+
+    def __len__(self):
+        return self.count
+
+    def get(self, key):
+        i = bisect_left(self.keyView, key)
+        if i < self.count:
+            k, val = self.record(i)
+            if k == key:
+                return val
+
+        return None
+
+    def min(self):
+        if not self.count:
+            return None
+
+        return self.record(0)[1]
+
+    def max(self):
+        if not self.count:
+            return None
+
+        return self.record(self.count - 1)[1]
+
+    def floor(self, key):
+        i = bisect_right(self.keyView, key)
+        if i == 0:
+            return None
+
+        return self.keyView[i-1]
+
+    def ceiling(self, key):
+        i = bisect_left(self.keyView, key)
+        if i == self.count:
+            return None
+
+        return self.keyView[i]
+
+    def rank(self, key):
+        return bisect_left(self.keyView, key)
+
+    # @return : the key with rank i, i.e. the (i+1)th smallest key
+    def select(self, i):
+        if i < 0 or i >= self.count:
+            return None
+
+        return self.keyView[i]
+
+    def rangeCount(self, loKey, hiKey):
+        return bisect_right(self.keyView, hiKey) - bisect_left(self.keyView, loKey)
+
+    def __positions(self, loKey, hiKey, reverse):
+        lo = 0 if loKey is None else bisect_left(self.keyView, loKey)
+        hi = self.count if hiKey is None else bisect_right(self.keyView, hiKey)
+        if reverse:
+            return range(hi - 1, lo - 1, -1)
+
+        return range(lo, hi)
+
+    # @return : generator over the keys in [loKey, hiKey], in order
+    def keys(self, loKey=None, hiKey=None, reverse=False):
+        for i in self.__positions(loKey, hiKey, reverse):
+            yield self.record(i)[0]
+
+    # @return : generator over the (key, val) pairs in [loKey, hiKey], in order
+    def items(self, loKey=None, hiKey=None, reverse=False):
+        for i in self.__positions(loKey, hiKey, reverse):
+            yield self.record(i)
+
+    def __iter__(self):
+        return self.items()
+
+    def __reversed__(self):
+        return self.items(reverse=True)
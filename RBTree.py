@@ -4,6 +4,8 @@ class RBNode:
     RED = True
     BLACK = False
     
+    __slots__ = ("key", "val", "left", "right", "color", "count")
+    
     def __init__(self, key, val):
         self.key = key
         self.val = val
@@ -34,34 +36,97 @@ class RBTree:
 
             raise StopIteration
             
-    def __init__(self):
+    # @param persistent : if True, writes never modify a node in place but
+    #                     copy the O(log n) nodes they touch, so snapshots
+    #                     of earlier versions stay valid
+    def __init__(self, persistent=False):
         self.root = None
+        self.persistent = persistent
+        # nodes created by the write in progress, which it may modify in
+        # place; None when nodes are always modified in place
+        self.__fresh = None
+        
+    def __copy(self, node):
+        copy = RBNode(node.key, node.val)
+        copy.left = node.left
+        copy.right = node.right
+        copy.color = node.color
+        copy.count = node.count
+        self.__fresh.add(id(copy))
+        return copy
+    
+    def __own(self, node):
+        # @return : node, or a private copy of it if it may be shared with
+        #           a snapshot
+        if self.__fresh is None or id(node) in self.__fresh:
+            return node
+        
+        return self.__copy(node)
+    
+    def __beginWrite(self):
+        if self.persistent:
+            self.__fresh = set()
+            
+    def __endWrite(self):
+        self.__fresh = None
+    
+    # @return : a view of the current contents that later writes to this
+    #           tree do not affect; it can be read and iterated from other
+    #           threads without locking
+    def snapshot(self):
+        if not self.persistent:
+            raise ValueError("snapshot() requires a persistent tree")
+        
+        view = type(self)(persistent=True)
+        view.root = self.root
+        return view
     
     def __rotateLeft(self, node):
-        temp = node.right
+        node = self.__own(node)
+        temp = self.__own(node.right)
         node.right = temp.left
         temp.left = node
         
         temp.color = node.color
         node.color = RBNode.RED
         
+        # This is a fix for a bug in Robert Sedgewick's lecture notes
+        temp.count = node.count
+        node.count = (1 + self.__size(node.left) + self.__size(node.right))
+        
         return temp
     
     def __rotateRight(self, node):
-        temp = node.left
+        node = self.__own(node)
+        temp = self.__own(node.left)
         node.left = temp.right
         temp.right = node
         
         temp.color = node.color
         node.color = RBNode.RED
         
+        # This is a fix for a bug in Robert Sedgewick's lecture notes
+        temp.count = node.count
+        node.count = (1 + self.__size(node.left) + self.__size(node.right))
+        
         return temp
     
     def __flipColors(self, node):
+        node.left = self.__own(node.left)
+        node.right = self.__own(node.right)
         node.color = RBNode.RED
         node.left.color = RBNode.BLACK
         node.right.color = RBNode.BLACK
         
+    def __invertColors(self, node):
+        # used on the way down a delete to borrow from or merge with a
+        # sibling, the reverse of __flipColors
+        node.left = self.__own(node.left)
+        node.right = self.__own(node.right)
+        node.color = not node.color
+        node.left.color = not node.left.color
+        node.right.color = not node.right.color
+        
     def __isRed(self, node):
         if not node:
             return False
@@ -80,39 +145,293 @@ class RBTree:
         
         return self.__size(self.root)
         
-    def __put(self, node, key, val):
-        if not node:
-            return RBNode(key, val)
+    def __fixUp(self, node):
+        # restore the left leaning invariants on the way back up from an
+        # insert or delete; the colour checks are inlined since this runs once per
+        # level on every put
+        left = node.left
+        right = node.right
+        if right and right.color and not (left and left.color):
+            node = self.__rotateLeft(node)
+            left = node.left
+            right = node.right
+        
+        if left and left.color and left.left and left.left.color:
+            node = self.__rotateRight(node)
+            left = node.left
+            right = node.right
+            
+        if left and left.color and right and right.color:
+            self.__flipColors(node)
         
-        if key < node.key:
-            node.left = self.__put(node.left, key, val)
+        node.count = (1 + (left.count if left else 0) + (right.count if right else 0))
+        return node
+        
+    def put(self, key, val):
+        # walk down iteratively, keeping the path so it can be fixed up
+        # bottom-up without a recursive call per level
+        path = []
+        node = self.root
+        while node:
+            if key < node.key:
+                path.append(node)
+                node = node.left
+                
+            elif key > node.key:
+                path.append(node)
+                node = node.right
+                
+            else:
+                # replacing a value leaves the shape of the tree unchanged
+                if not self.persistent:
+                    node.val = val
+                    return
+                break
+        
+        self.__beginWrite()
+        if node:
+            child = self.__copy(node)
+            child.val = val
+        else:
+            child = RBNode(key, val)
+            
+        while path:
+            node = path.pop()
+            if self.persistent:
+                node = self.__copy(node)
+                
+            if key < node.key:
+                node.left = child
+            else:
+                node.right = child
+            child = self.__fixUp(node)
             
-        elif key > node.key:
-            node.right = self.__put(node.right, key, val)
+        self.root = child
+        self.__endWrite()
+        
+    def __buildSorted(self, items, lo, hi, height):
+        # build items[lo:hi] as a 2-3 tree with every leaf at the given
+        # black height, encoding 3-nodes as a black node with a red left
+        # child, so the result is a valid left leaning red-black tree
+        n = hi - lo
+        if height == 0:
+            return None
+        
+        maxChild = 3**(height-1) - 1
+        if n - 1 <= 2 * maxChild:
+            # 2-node
+            leftCount = (n - 1) // 2
+            mid = lo + leftCount
+            node = RBNode(items[mid][0], items[mid][1])
+            node.color = RBNode.BLACK
+            node.left = self.__buildSorted(items, lo, mid, height-1)
+            node.right = self.__buildSorted(items, mid+1, hi, height-1)
             
         else:
-            node.val = val
+            # 3-node
+            leftCount = (n - 2) // 3
+            midCount = (n - 2 - leftCount) // 2
+            lo2 = lo + leftCount
+            hi2 = lo2 + midCount + 1
             
-        if self.__isRed(node.right) and not self.__isRed(node.left):
-            # This is a fix for a bug in Robert Sedgewick's lecture notes
-            tnode = self.__rotateLeft(node)
-            node.count = (1 + self.__size(node.left) + self.__size(node.right))
-            node = tnode
-        
-        if self.__isRed(node.left) and self.__isRed(node.left.left):
-            # This is a fix for a bug in Robert Sedgewick's lecture notes
-            tnode = self.__rotateRight(node)
-            node.count = (1 + self.__size(node.left) + self.__size(node.right))
-            node = tnode
+            redNode = RBNode(items[lo2][0], items[lo2][1])
+            redNode.left = self.__buildSorted(items, lo, lo2, height-1)
+            redNode.right = self.__buildSorted(items, lo2+1, hi2, height-1)
+            redNode.count = leftCount + midCount + 1
             
-        if self.__isRed(node.left) and self.__isRed(node.right):
-            self.__flipColors(node)
+            node = RBNode(items[hi2][0], items[hi2][1])
+            node.color = RBNode.BLACK
+            node.left = redNode
+            node.right = self.__buildSorted(items, hi2+1, hi, height-1)
+            
+        node.count = n
+        return node
+    
+    # @param items : (key, val) pairs in strictly increasing key order
+    # @param persistent : as for __init__
+    # @return : a balanced tree holding items, built in O(n)
+    @classmethod
+    def from_sorted(cls, items, persistent=False):
+        items = list(items)
+        for i in range(1, len(items)):
+            if not items[i-1][0] < items[i][0]:
+                raise ValueError("keys must be strictly increasing")
+        
+        # smallest black height whose 2-3 trees can hold every key
+        height = 0
+        while 3**height - 1 < len(items):
+            height += 1
+            
+        bst = cls(persistent=persistent)
+        bst.root = bst.__buildSorted(items, 0, len(items), height)
+        return bst
+    
+    # @return : a new tree holding the keys of both trees, persistent if
+    #           this one is; where both hold a key the value from other is
+    #           kept
+    def merge(self, other):
+        merged = []
+        mine = self.items()
+        theirs = other.items()
+        a = next(mine, None)
+        b = next(theirs, None)
+        
+        while a is not None and b is not None:
+            if a[0] < b[0]:
+                merged.append(a)
+                a = next(mine, None)
+                
+            elif a[0] > b[0]:
+                merged.append(b)
+                b = next(theirs, None)
+                
+            else:
+                merged.append(b)
+                a = next(mine, None)
+                b = next(theirs, None)
         
-        node.count = (1 + self.__size(node.left) + self.__size(node.right))
+        if a is not None:
+            merged.append(a)
+            merged.extend(mine)
+            
+        if b is not None:
+            merged.append(b)
+            merged.extend(theirs)
+            
+        return type(self).from_sorted(merged, persistent=self.persistent)
+    
+    def __moveRedLeft(self, node):
+        # make node.left or one of its children red
+        self.__invertColors(node)
+        if self.__isRed(node.right.left):
+            node.right = self.__rotateRight(node.right)
+            node = self.__rotateLeft(node)
+            self.__invertColors(node)
+            
+        return node
+    
+    def __moveRedRight(self, node):
+        # make node.right or one of its children red
+        self.__invertColors(node)
+        if self.__isRed(node.left.left):
+            node = self.__rotateRight(node)
+            self.__invertColors(node)
+            
         return node
+    
+    def __deleteMin(self, node):
+        if not node.left:
+            return None
         
-    def put(self, key, val):
-        self.root = self.__put(self.root, key, val)
+        node = self.__own(node)
+        if not self.__isRed(node.left) and not self.__isRed(node.left.left):
+            node = self.__moveRedLeft(node)
+            
+        node.left = self.__deleteMin(node.left)
+        return self.__fixUp(node)
+    
+    def __deleteMax(self, node):
+        node = self.__own(node)
+        if self.__isRed(node.left):
+            node = self.__rotateRight(node)
+            
+        if not node.right:
+            return None
+        
+        if not self.__isRed(node.right) and not self.__isRed(node.right.left):
+            node = self.__moveRedRight(node)
+            
+        node.right = self.__deleteMax(node.right)
+        return self.__fixUp(node)
+    
+    def __delete(self, node, key):
+        node = self.__own(node)
+        if key < node.key:
+            if not self.__isRed(node.left) and not self.__isRed(node.left.left):
+                node = self.__moveRedLeft(node)
+                
+            node.left = self.__delete(node.left, key)
+            
+        else:
+            if self.__isRed(node.left):
+                node = self.__rotateRight(node)
+                
+            if key == node.key and not node.right:
+                return None
+            
+            if not self.__isRed(node.right) and not self.__isRed(node.right.left):
+                node = self.__moveRedRight(node)
+                
+            if key == node.key:
+                # replace with the successor, then remove the successor
+                successor = node.right
+                while successor.left:
+                    successor = successor.left
+                    
+                node.key = successor.key
+                node.val = successor.val
+                node.right = self.__deleteMin(node.right)
+                
+            else:
+                node.right = self.__delete(node.right, key)
+                
+        return self.__fixUp(node)
+    
+    def __prepareRootForDelete(self):
+        # the root is treated as black; if both its children are black it
+        # is made red so there is a red link to push down the tree
+        self.root = self.__own(self.root)
+        self.root.color = RBNode.BLACK
+        if not self.__isRed(self.root.left) and not self.__isRed(self.root.right):
+            self.root.color = RBNode.RED
+    
+    def deleteMin(self):
+        if not self.root:
+            return
+        
+        self.__beginWrite()
+        self.__prepareRootForDelete()
+        self.root = self.__deleteMin(self.root)
+        if self.root:
+            self.root.color = RBNode.BLACK
+        self.__endWrite()
+            
+    def deleteMax(self):
+        if not self.root:
+            return
+        
+        self.__beginWrite()
+        self.__prepareRootForDelete()
+        self.root = self.__deleteMax(self.root)
+        if self.root:
+            self.root.color = RBNode.BLACK
+        self.__endWrite()
+    
+    def delete(self, key):
+        if not self.__contains(key):
+            return
+        
+        self.__beginWrite()
+        self.__prepareRootForDelete()
+        self.root = self.__delete(self.root, key)
+        if self.root:
+            self.root.color = RBNode.BLACK
+        self.__endWrite()
+    
+    def __contains(self, key):
+        currNode = self.root
+        
+        while currNode:
+            if key < currNode.key:
+                currNode = currNode.left
+                
+            elif key > currNode.key:
+                currNode = currNode.right
+                
+            else:
+                return True
+            
+        return False
         
     def get(self, key):
         currNode = self.root
@@ -130,6 +449,9 @@ class RBTree:
         return None
     
     def min(self):
+        if not self.root:
+            return None
+        
         currNode = self.root
         
         while currNode.left:
@@ -138,6 +460,9 @@ class RBTree:
         return currNode.val
     
     def max(self):
+        if not self.root:
+            return None
+        
         currNode = self.root
         
         while currNode.right:
@@ -145,65 +470,126 @@ class RBTree:
             
         return currNode.val
     
-    def __floor(self, node, key):
-        if not node:
-            return None
-        
-        if key == node.key:
-            return node
-        
-        elif key < node.key:
-            return self.__floor(node.left, key)
-        
-        else:
-            t = self.__floor(node.right, key)
-            return t if t else node
-        
     def floor(self, key):
-        node = self.__floor(self.root, key)
+        currNode = self.root
+        floorNode = None
         
-        if not node:
+        while currNode:
+            if key < currNode.key:
+                currNode = currNode.left
+                
+            elif key > currNode.key:
+                floorNode = currNode
+                currNode = currNode.right
+                
+            else:
+                return currNode.key
+            
+        if not floorNode:
             return None
         
-        return node.key
+        return floorNode.key
     
-    def __ceiling(self, node, key):
-        if not node:
-            return None
-        
-        if key == node.key:
-            return node
+    def ceiling(self, key):
+        currNode = self.root
+        ceilingNode = None
         
-        elif key > node.key:
-            return self.__ceiling(node.right, key)
+        while currNode:
+            if key > currNode.key:
+                currNode = currNode.right
+                
+            elif key < currNode.key:
+                ceilingNode = currNode
+                currNode = currNode.left
+                
+            else:
+                return currNode.key
             
-        else:
-            t = self.__ceiling(node.left, key)
-            return t if t else node
+        if not ceilingNode:
+            return None
         
-    def ceiling(self, key):
-        node = self.__ceiling(self.root, key)
+        return ceilingNode.key
+    
+    def rank(self, key):
+        currNode = self.root
+        r = 0
         
-        if not node:
+        while currNode:
+            if key < currNode.key:
+                currNode = currNode.left
+                
+            elif key > currNode.key:
+                r += 1 + self.__size(currNode.left)
+                currNode = currNode.right
+                
+            else:
+                return r + self.__size(currNode.left)
+            
+        return r
+    
+    # @return : the key with rank i, i.e. the (i+1)th smallest key
+    def select(self, i):
+        if i < 0 or i >= self.size():
             return None
         
-        return node.key
+        currNode = self.root
+        while currNode:
+            leftCount = self.__size(currNode.left)
+            if i < leftCount:
+                currNode = currNode.left
+                
+            elif i > leftCount:
+                i -= leftCount + 1
+                currNode = currNode.right
+                
+            else:
+                return currNode.key
+            
+        return None
     
-    def __rank(self, node, key):
-        if not node:
-            return 0
-        
-        if key < node.key:
-            return self.__rank(node.left, key)
+    def __nodes(self, loKey, hiKey, reverse):
+        # in-order walk that seeks straight to the first key in range and
+        # stops after the last one; None leaves that end unbounded
+        if reverse:
+            first, second = "right", "left"
+            startKey, stopKey = hiKey, loKey
+            before = lambda key, bound: key > bound
+        else:
+            first, second = "left", "right"
+            startKey, stopKey = loKey, hiKey
+            before = lambda key, bound: key < bound
         
-        elif key > node.key:
-            return (1 + self.__size(node.left) + self.__rank(node.right, key))
+        # push the path of nodes at or after startKey
+        stack = []
+        currNode = self.root
+        while currNode:
+            if startKey is not None and before(currNode.key, startKey):
+                currNode = getattr(currNode, second)
+            else:
+                stack.append(currNode)
+                currNode = getattr(currNode, first)
         
-        else:
-            return self.__size(node.left)
+        while stack:
+            node = stack.pop()
+            if stopKey is not None and before(stopKey, node.key):
+                return
+            
+            yield node
+            
+            currNode = getattr(node, second)
+            while currNode:
+                stack.append(currNode)
+                currNode = getattr(currNode, first)
     
-    def rank(self, key):
-        return self.__rank(self.root, key)
+    # @return : generator over the keys in [loKey, hiKey], in order
+    def keys(self, loKey=None, hiKey=None, reverse=False):
+        for node in self.__nodes(loKey, hiKey, reverse):
+            yield node.key
+            
+    # @return : generator over the (key, val) pairs in [loKey, hiKey], in order
+    def items(self, loKey=None, hiKey=None, reverse=False):
+        for node in self.__nodes(loKey, hiKey, reverse):
+            yield node.key, node.val
     
     def rangeCount(self, loKey, hiKey):
         hiKeyVal = self.get(hiKey)
@@ -217,6 +603,10 @@ class RBTree:
     def __iter__(self):
         return self.RBTreeIterator(self)
     
+    def __reversed__(self):
+        for node in self.__nodes(None, None, True):
+            yield node.key, node.val, node.count
+    
 
 bst = RBTree()
 
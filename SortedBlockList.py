@@ -0,0 +1,250 @@
+# ordered map stored as a list of sorted blocks
+#
+# Offers the same interface as RBTree, but keys live in plain Python lists
+# of at most BLOCK_SIZE entries that are searched with bisect, so most of
+# the work of a lookup or insert happens inside C list operations instead of
+# chasing one node object per level.
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+
+class SortedBlockList:
+    BLOCK_SIZE = 512
+
+    def __init__(self):
+        # keyBlocks[i] and valBlocks[i] are parallel sorted lists and
+        # maxes[i] is the largest key in keyBlocks[i]
+        self.keyBlocks = []
+        self.valBlocks = []
+        self.maxes = []
+        self.count = 0
+        # offsets[i] is the number of keys before keyBlocks[i]; rebuilt
+        # lazily after inserts and deletes
+        self.offsets = None
+
+    def size(self):
+        return self.count
+
+    def __len__(self):
+        return self.count
+
+    def __offset(self, i):
+        if self.offsets is None:
+            self.offsets = [0]
+            self.offsets.extend(accumulate(map(len, self.keyBlocks)))
+
+        return self.offsets[i]
+
+    def __split(self, i):
+        half = len(self.keyBlocks[i]) // 2
+        self.keyBlocks.insert(i+1, self.keyBlocks[i][half:])
+        self.valBlocks.insert(i+1, self.valBlocks[i][half:])
+        del self.keyBlocks[i][half:]
+        del self.valBlocks[i][half:]
+        self.maxes.insert(i, self.keyBlocks[i][-1])
+
+    def put(self, key, val):
+        if not self.maxes:
+            self.keyBlocks.append([key])
+            self.valBlocks.append([val])
+            self.maxes.append(key)
+            self.count = 1
+            self.offsets = None
+            return
+
+        i = bisect_left(self.maxes, key)
+        if i == len(self.maxes):
+            # larger than every key, goes at the end of the last block
+            i -= 1
+
+        keys = self.keyBlocks[i]
+        j = bisect_left(keys, key)
+        if j < len(keys) and keys[j] == key:
+            self.valBlocks[i][j] = val
+            return
+
+        keys.insert(j, key)
+        self.valBlocks[i].insert(j, val)
+        self.maxes[i] = keys[-1]
+        self.count += 1
+        self.offsets = None
+
+        if len(keys) > self.BLOCK_SIZE:
+            self.__split(i)
+
+    def get(self, key):
+        i = bisect_left(self.maxes, key)
+        if i == len(self.maxes):
+            return None
+
+        keys = self.keyBlocks[i]
+        j = bisect_left(keys, key)
+        if keys[j] == key:
+            return self.valBlocks[i][j]
+
+        return None
+
+    def __contains(self, key):
+        i = bisect_left(self.maxes, key)
+        if i == len(self.maxes):
+            return False
+
+        keys = self.keyBlocks[i]
+        return keys[bisect_left(keys, key)] == key
+
+    def min(self):
+        if not self.maxes:
+            return None
+
+        return self.valBlocks[0][0]
+
+    def max(self):
+        if not self.maxes:
+            return None
+
+        return self.valBlocks[-1][-1]
+
+    def floor(self, key):
+        i = bisect_left(self.maxes, key)
+        if i < len(self.maxes):
+            keys = self.keyBlocks[i]
+            j = bisect_right(keys, key)
+            if j:
+                return keys[j-1]
+
+        if i > 0:
+            return self.maxes[i-1]
+
+        return None
+
+    def ceiling(self, key):
+        i = bisect_left(self.maxes, key)
+        if i == len(self.maxes):
+            return None
+
+        keys = self.keyBlocks[i]
+        return keys[bisect_left(keys, key)]
+
+    def rank(self, key):
+        i = bisect_left(self.maxes, key)
+        if i == len(self.maxes):
+            return self.count
+
+        return self.__offset(i) + bisect_left(self.keyBlocks[i], key)
+
+    # @return : the key with rank i, i.e. the (i+1)th smallest key
+    def select(self, i):
+        if i < 0 or i >= self.count:
+            return None
+
+        self.__offset(0)
+        b = bisect_right(self.offsets, i) - 1
+        return self.keyBlocks[b][i - self.offsets[b]]
+
+    def rangeCount(self, loKey, hiKey):
+        if self.__contains(hiKey):
+            return (self.rank(hiKey) - self.rank(loKey) + 1)
+
+        else:
+            return (self.rank(hiKey) - self.rank(loKey))
+
+    def __remove(self, i, j):
+        keys = self.keyBlocks[i]
+        del keys[j]
+        del self.valBlocks[i][j]
+        self.count -= 1
+        self.offsets = None
+
+        if not keys:
+            del self.keyBlocks[i]
+            del self.valBlocks[i]
+            del self.maxes[i]
+            return
+
+        self.maxes[i] = keys[-1]
+
+        # fold small blocks into their neighbour so deletes do not leave a
+        # long list of nearly empty blocks behind
+        if len(keys) < self.BLOCK_SIZE // 4 and len(self.maxes) > 1:
+            if i == len(self.maxes) - 1:
+                i -= 1
+
+            self.keyBlocks[i] += self.keyBlocks[i+1]
+            self.valBlocks[i] += self.valBlocks[i+1]
+            self.maxes[i] = self.maxes[i+1]
+            del self.keyBlocks[i+1]
+            del self.valBlocks[i+1]
+            del self.maxes[i+1]
+
+            if len(self.keyBlocks[i]) > self.BLOCK_SIZE:
+                self.__split(i)
+
+    def delete(self, key):
+        i = bisect_left(self.maxes, key)
+        if i == len(self.maxes):
+            return
+
+        j = bisect_left(self.keyBlocks[i], key)
+        if self.keyBlocks[i][j] == key:
+            self.__remove(i, j)
+
+    def deleteMin(self):
+        if self.maxes:
+            self.__remove(0, 0)
+
+    def deleteMax(self):
+        if self.maxes:
+            self.__remove(len(self.maxes) - 1, len(self.keyBlocks[-1]) - 1)
+
+    def __positions(self, loKey, hiKey, reverse):
+        # yields (block, index) for each key in [loKey, hiKey]; None leaves
+        # that end unbounded
+        if loKey is None:
+            loBlock, loIndex = 0, 0
+        else:
+            loBlock = bisect_left(self.maxes, loKey)
+            loIndex = 0
+            if loBlock < len(self.maxes):
+                loIndex = bisect_left(self.keyBlocks[loBlock], loKey)
+
+        if hiKey is None:
+            hiBlock = len(self.maxes) - 1
+            hiIndex = len(self.keyBlocks[hiBlock]) if self.maxes else 0
+        else:
+            hiBlock = bisect_left(self.maxes, hiKey)
+            if hiBlock == len(self.maxes):
+                hiBlock -= 1
+                hiIndex = len(self.keyBlocks[hiBlock]) if self.maxes else 0
+            else:
+                hiIndex = bisect_right(self.keyBlocks[hiBlock], hiKey)
+
+        blocks = range(loBlock, hiBlock + 1)
+        if reverse:
+            blocks = reversed(blocks)
+
+        for b in blocks:
+            start = loIndex if b == loBlock else 0
+            stop = hiIndex if b == hiBlock else len(self.keyBlocks[b])
+            indices = range(start, stop)
+            if reverse:
+                indices = reversed(indices)
+
+            for j in indices:
+                yield b, j
+
+    # @return : generator over the keys in [loKey, hiKey], in order
+    def keys(self, loKey=None, hiKey=None, reverse=False):
+        for b, j in self.__positions(loKey, hiKey, reverse):
+            yield self.keyBlocks[b][j]
+
+    # @return : generator over the (key, val) pairs in [loKey, hiKey], in order
+    def items(self, loKey=None, hiKey=None, reverse=False):
+        for b, j in self.__positions(loKey, hiKey, reverse):
+            yield self.keyBlocks[b][j], self.valBlocks[b][j]
+
+    # unlike RBTree, which also yields the subtree count of each node,
+    # iteration yields (key, val) pairs
+    def __iter__(self):
+        return self.items()
+
+    def __reversed__(self):
+        return self.items(reverse=True)
@@ -0,0 +1,339 @@
+# Benchmarks for the data structures in this repository
+#
+# usage:
+#   python benchmark.py memory [N]
+#   python benchmark.py rbtree [N]
+#   python benchmark.py ordered [N]
+#   python benchmark.py dequeue [N]
+#   python benchmark.py conntable [N]
+import importlib.util
+import os
+import collections
+import random
+import socket
+import sys
+import time
+import tracemalloc
+
+from RBTree import RBNode, RBTree
+from SortedBlockList import SortedBlockList
+from dequeue import DequeueDLList, DequeueRingBuffer
+
+# 2DTree.py is not a valid module name, so load it from its path
+spec = importlib.util.spec_from_file_location(
+    "Tree2D", os.path.join(os.path.dirname(os.path.abspath(__file__)), "2DTree.py"))
+tree2d = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(tree2d)
+
+def bytes_per_element(build, n):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    structure = build(n)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del structure
+    return (after - before) / n
+
+def build_tree2d(n):
+    return tree2d.Tree2D.from_points(
+        tree2d.Point2D(random.random(), random.random()) for i in range(n))
+
+def build_rbtree(n):
+    bst = RBTree()
+    for key in random.sample(range(n * 10), n):
+        bst.put(key, None)
+    return bst
+
+def build_dequeue(n):
+    dq = DequeueDLList()
+    for i in range(n):
+        dq.push(None)
+    return dq
+
+def memory(n):
+    print("{:20}{:>15}".format("structure", "bytes/element"))
+    for name, build in [
+        ("Tree2D", build_tree2d),
+        ("RBTree", build_rbtree),
+        ("DequeueDLList", build_dequeue),
+    ]:
+        print("{:20}{:>15.1f}".format(name, bytes_per_element(build, n)))
+
+def ops_per_second(op, keys):
+    start = time.perf_counter()
+    for key in keys:
+        op(key)
+    return len(keys) / (time.perf_counter() - start)
+
+class RecursiveRBTree:
+    # the recursive put, floor, ceiling and rank that RBTree used before they
+    # were made iterative, kept as the baseline for the rbtree benchmark
+    def __init__(self):
+        self.root = None
+    
+    def __rotateLeft(self, node):
+        temp = node.right
+        node.right = temp.left
+        temp.left = node
+        temp.color = node.color
+        node.color = RBNode.RED
+        return temp
+    
+    def __rotateRight(self, node):
+        temp = node.left
+        node.left = temp.right
+        temp.right = node
+        temp.color = node.color
+        node.color = RBNode.RED
+        return temp
+    
+    def __flipColors(self, node):
+        node.color = RBNode.RED
+        node.left.color = RBNode.BLACK
+        node.right.color = RBNode.BLACK
+    
+    def __isRed(self, node):
+        if not node:
+            return False
+        return node.color == RBNode.RED
+    
+    def __size(self, node):
+        if not node:
+            return 0
+        return node.count
+    
+    def __put(self, node, key, val):
+        if not node:
+            return RBNode(key, val)
+        
+        if key < node.key:
+            node.left = self.__put(node.left, key, val)
+        elif key > node.key:
+            node.right = self.__put(node.right, key, val)
+        else:
+            node.val = val
+        
+        if self.__isRed(node.right) and not self.__isRed(node.left):
+            tnode = self.__rotateLeft(node)
+            node.count = (1 + self.__size(node.left) + self.__size(node.right))
+            node = tnode
+        
+        if self.__isRed(node.left) and self.__isRed(node.left.left):
+            tnode = self.__rotateRight(node)
+            node.count = (1 + self.__size(node.left) + self.__size(node.right))
+            node = tnode
+        
+        if self.__isRed(node.left) and self.__isRed(node.right):
+            self.__flipColors(node)
+        
+        node.count = (1 + self.__size(node.left) + self.__size(node.right))
+        return node
+    
+    def put(self, key, val):
+        self.root = self.__put(self.root, key, val)
+    
+    def get(self, key):
+        currNode = self.root
+        while currNode:
+            if key < currNode.key:
+                currNode = currNode.left
+            elif key > currNode.key:
+                currNode = currNode.right
+            else:
+                return currNode.val
+        return None
+    
+    def __floor(self, node, key):
+        if not node:
+            return None
+        if key == node.key:
+            return node
+        elif key < node.key:
+            return self.__floor(node.left, key)
+        else:
+            t = self.__floor(node.right, key)
+            return t if t else node
+    
+    def floor(self, key):
+        node = self.__floor(self.root, key)
+        if not node:
+            return None
+        return node.key
+    
+    def __ceiling(self, node, key):
+        if not node:
+            return None
+        if key == node.key:
+            return node
+        elif key > node.key:
+            return self.__ceiling(node.right, key)
+        else:
+            t = self.__ceiling(node.left, key)
+            return t if t else node
+    
+    def ceiling(self, key):
+        node = self.__ceiling(self.root, key)
+        if not node:
+            return None
+        return node.key
+    
+    def __rank(self, node, key):
+        if not node:
+            return 0
+        if key < node.key:
+            return self.__rank(node.left, key)
+        elif key > node.key:
+            return (1 + self.__size(node.left) + self.__rank(node.right, key))
+        else:
+            return self.__size(node.left)
+    
+    def rank(self, key):
+        return self.__rank(self.root, key)
+
+def rbtree(n):
+    inputs = {
+        "random": random.sample(range(n * 10), n),
+        "sorted": list(range(0, n * 10, 10)),
+    }
+    queries = [random.randrange(n * 10) for i in range(n)]
+    columns = [(order, cls) for order in inputs for cls in [RecursiveRBTree, RBTree]]
+
+    rates = {}
+    trees = {}
+    for order, cls in columns:
+        keys = inputs[order]
+        bst = trees[(order, cls)] = cls()
+        rates[("put", order, cls)] = ops_per_second(lambda key: bst.put(key, key), keys)
+        rates[("get", order, cls)] = ops_per_second(bst.get, queries)
+        rates[("floor", order, cls)] = ops_per_second(bst.floor, queries)
+        rates[("ceiling", order, cls)] = ops_per_second(bst.ceiling, queries)
+        rates[("rank", order, cls)] = ops_per_second(bst.rank, queries)
+
+    print("{:20}".format("operation") + "".join(
+        "{:>20}".format("{} {}".format(order, "recursive" if cls is RecursiveRBTree else "iterative"))
+        for order, cls in columns))
+    for op in ["put", "get", "floor", "ceiling", "rank"]:
+        print("{:20}".format(op) + "".join(
+            "{:>20.0f}".format(rates[(op, order, cls)]) for order, cls in columns))
+
+    items = list(trees[("sorted", RBTree)].items())
+    start = time.perf_counter()
+    RBTree.from_sorted(items)
+    print("{:20}{:>20.0f}".format(
+        "from_sorted", len(items) / (time.perf_counter() - start)))
+
+def ordered(n):
+    keys = random.sample(range(n * 10), n)
+    queries = [random.randrange(n * 10) for i in range(n)]
+
+    rates = {}
+    for cls in [RBTree, SortedBlockList]:
+        bst = cls()
+        rates[("put", cls)] = ops_per_second(lambda key: bst.put(key, key), keys)
+        rates[("get", cls)] = ops_per_second(bst.get, queries)
+        rates[("floor", cls)] = ops_per_second(bst.floor, queries)
+        rates[("ceiling", cls)] = ops_per_second(bst.ceiling, queries)
+        rates[("rank", cls)] = ops_per_second(bst.rank, queries)
+
+        start = time.perf_counter()
+        for item in bst.items():
+            pass
+        rates[("iterate", cls)] = n / (time.perf_counter() - start)
+
+        rates[("delete", cls)] = ops_per_second(bst.delete, keys)
+
+        # interleaved writes and rank queries; the block list has to
+        # rebuild its offsets after every write, so this uses fewer keys
+        bst = cls()
+        def put_rank(key):
+            bst.put(key, key)
+            bst.rank(key)
+        rates[("put+rank", cls)] = ops_per_second(put_rank, keys[:100000])
+
+    print("{:20}{:>15}{:>20}".format("operation", "RBTree", "SortedBlockList"))
+    for op in ["put", "get", "floor", "ceiling", "rank", "iterate", "delete", "put+rank"]:
+        print("{:20}{:>15.0f}{:>20.0f}".format(
+            op, rates[(op, RBTree)], rates[(op, SortedBlockList)]))
+
+def dequeue(n):
+    rates = {}
+    for name, cls in [
+        ("DequeueDLList", DequeueDLList),
+        ("DequeueRingBuffer", DequeueRingBuffer),
+        ("collections.deque", collections.deque),
+    ]:
+        dq = cls()
+        if cls is collections.deque:
+            push, pushFront, pop, popFront = dq.append, dq.appendleft, dq.pop, dq.popleft
+        else:
+            push, pushFront, pop, popFront = dq.push, dq.pushFront, dq.pop, dq.popFront
+
+        items = range(1, n + 1)
+        rates[("push", name)] = ops_per_second(push, items)
+
+        start = time.perf_counter()
+        for item in dq:
+            pass
+        rates[("iterate", name)] = n / (time.perf_counter() - start)
+
+        rates[("popFront", name)] = ops_per_second(lambda item: popFront(), items)
+        rates[("pushFront", name)] = ops_per_second(pushFront, items)
+        rates[("pop", name)] = ops_per_second(lambda item: pop(), items)
+
+    names = ["DequeueDLList", "DequeueRingBuffer", "collections.deque"]
+    print("{:20}".format("operation") + "".join("{:>20}".format(name) for name in names))
+    for op in ["push", "iterate", "popFront", "pushFront", "pop"]:
+        print("{:20}".format(op) + "".join("{:>20.0f}".format(rates[(op, name)]) for name in names))
+
+def conntable(n):
+    # open n loopback connections (half of them accepted ends), as far as
+    # the file descriptor limit allows, then time a full table snapshot.
+    # resource is Unix only and conntable needs psutil, so they are
+    # imported here to keep the other benchmarks running on Windows.
+    import resource
+    from conntable import ProcNetProvider, PsutilProvider
+    
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    n = min(n, hard - 100)
+
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(1024)
+    sockets = [listener]
+    while len(sockets) < n:
+        sockets.append(socket.create_connection(listener.getsockname()))
+        sockets.append(listener.accept()[0])
+
+    print("{} sockets".format(len(sockets)))
+    print("{:20}{:>15}{:>15}".format("provider", "rows", "seconds"))
+    for name, provider in [
+        ("ProcNetProvider", ProcNetProvider()),
+        ("PsutilProvider", PsutilProvider()),
+    ]:
+        start = time.perf_counter()
+        rows = provider.tcp_rows()
+        print("{:20}{:>15}{:>15.3f}".format(name, len(rows), time.perf_counter() - start))
+
+    for s in sockets:
+        s.close()
+
+if __name__ == "__main__":
+    random.seed(17)
+
+    n = 1000000
+    if len(sys.argv) > 2:
+        n = int(sys.argv[2])
+
+    if len(sys.argv) > 1 and sys.argv[1] == "memory":
+        memory(n)
+    elif len(sys.argv) > 1 and sys.argv[1] == "rbtree":
+        rbtree(n)
+    elif len(sys.argv) > 1 and sys.argv[1] == "ordered":
+        ordered(n)
+    elif len(sys.argv) > 1 and sys.argv[1] == "dequeue":
+        dequeue(n)
+    elif len(sys.argv) > 1 and sys.argv[1] == "conntable":
+        conntable(n)
+    else:
+        print("usage: python benchmark.py memory|rbtree|ordered|dequeue|conntable [N]")
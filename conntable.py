@@ -0,0 +1,339 @@
+# Connection table providers shared by netconn.py and sniff.py
+#
+# A provider's tcp_rows() returns the rows of the system TCP table as dicts
+# with src_ip, dst_ip, src_port, dst_port, pid and state, whatever the
+# platform, and find_tcp_row() returns the row of a single connection:
+#
+#   WindowsTcpTableProvider  GetTcpTable2 from iphlpapi
+#   ProcNetProvider          /proc/net on Linux
+#   PsutilProvider           psutil.net_connections, for everything else
+#
+# States use the MIB_TCP_STATE_* names on every platform. Sockets whose
+# owner cannot be found (other users' sockets without root, TIME_WAIT)
+# get pid 0.
+from ctypes import *
+import os
+import socket
+import struct
+import sys
+import psutil
+
+NO_ERROR = 0
+ERROR_INSUFFICIENT_BUFFER = 122
+ERROR_NOT_FOUND = 1168
+
+MIB_TCP_STATE_CLOSED = 1
+MIB_TCP_STATE_LISTEN = 2
+MIB_TCP_STATE_SYN_SENT = 3
+MIB_TCP_STATE_SYN_RCVD = 4
+MIB_TCP_STATE_ESTAB = 5
+MIB_TCP_STATE_FIN_WAIT1 = 6
+MIB_TCP_STATE_FIN_WAIT2 = 7
+MIB_TCP_STATE_CLOSE_WAIT = 8
+MIB_TCP_STATE_CLOSING = 9
+MIB_TCP_STATE_LAST_ACK = 10
+MIB_TCP_STATE_TIME_WAIT = 11
+MIB_TCP_STATE_DELETE_TCB = 12
+
+TcpConnectionOffloadStateInHost = 0
+TcpConnectionOffloadStateOffloading = 1
+TcpConnectionOffloadStateOffloaded = 2
+TcpConnectionOffloadStateUploading = 3
+TcpConnectionOffloadStateMax = 4
+
+class MIB_TCPROW2(Structure):
+    _fields_ = [
+        ("dwState", c_ulong),
+        ("dwLocalAddr", c_ulong),
+        ("dwLocalPort", c_ulong),
+        ("dwRemoteAddr", c_ulong),
+        ("dwRemotePort", c_ulong),
+        ("dwOwningPid", c_ulong),
+        ("dwOffloadState", c_ulong),
+    ]
+
+def MIB_TCPTABLE2_FACTORY(size):
+    class MIB_TCPTABLE2(Structure):
+        _fields_ = [
+            ("dwNumEntries", c_ulong),
+            ("table", MIB_TCPROW2 * size),
+        ]
+    return MIB_TCPTABLE2()
+
+def state_to_string(state):
+    if state == MIB_TCP_STATE_CLOSED:
+        return "MIB_TCP_STATE_CLOSED"
+    elif state == MIB_TCP_STATE_LISTEN:
+        return "MIB_TCP_STATE_LISTEN"
+    elif state == MIB_TCP_STATE_SYN_SENT:
+        return "MIB_TCP_STATE_SYN_SENT"
+    elif state == MIB_TCP_STATE_SYN_RCVD:
+        return "MIB_TCP_STATE_SYN_RCVD"
+    elif state == MIB_TCP_STATE_ESTAB:
+        return "MIB_TCP_STATE_ESTAB"
+    elif state == MIB_TCP_STATE_FIN_WAIT1:
+        return "MIB_TCP_STATE_FIN_WAIT1"
+    elif state == MIB_TCP_STATE_FIN_WAIT2:
+        return "MIB_TCP_STATE_FIN_WAIT2"
+    elif state == MIB_TCP_STATE_CLOSE_WAIT:
+        return "MIB_TCP_STATE_CLOSE_WAIT"
+    elif state == MIB_TCP_STATE_CLOSING:
+        return "MIB_TCP_STATE_CLOSING"
+    elif state == MIB_TCP_STATE_LAST_ACK:
+        return "MIB_TCP_STATE_LAST_ACK"
+    elif state == MIB_TCP_STATE_TIME_WAIT:
+        return "MIB_TCP_STATE_TIME_WAIT"
+    elif state == MIB_TCP_STATE_DELETE_TCB:
+        return "MIB_TCP_STATE_DELETE_TCB"
+    else:
+        return "<UNKNOWN>"
+
+# @return : the row of the connection between (sip, sport) and (dip,
+#           dport), in either direction, or None
+def find_row(rows, sip, dip, sport, dport):
+    for row in rows:
+        if row["src_port"] == sport and row["dst_port"] == dport \
+            and row["src_ip"] == sip and row["dst_ip"] == dip:
+            return row
+        
+        if row["src_port"] == dport and row["dst_port"] == sport \
+            and row["src_ip"] == dip and row["dst_ip"] == sip:
+            return row
+    
+    return None
+
+class WindowsTcpTableProvider:
+    def tcp_rows(self):
+        rows = []
+
+        windll.iphlpapi.GetTcpTable2.argtypes = [c_void_p, POINTER(c_ulong), c_bool]
+        tcp_table_size = c_ulong()
+
+        ret = windll.iphlpapi.GetTcpTable2(None, byref(tcp_table_size), True)
+        if ret == ERROR_INSUFFICIENT_BUFFER:
+            tcp_table = MIB_TCPTABLE2_FACTORY(tcp_table_size.value)
+
+            ret = windll.iphlpapi.GetTcpTable2(byref(tcp_table), byref(tcp_table_size), True)
+            if ret != NO_ERROR:
+                print("ERROR: GetTcpTable2() failed, error = " + str(ret))
+            else:
+                for i in range(tcp_table.dwNumEntries):
+                    rows.append({
+                        "src_ip" : socket.inet_ntoa(struct.pack('<L', tcp_table.table[i].dwLocalAddr)),
+                        "dst_ip" : socket.inet_ntoa(struct.pack('<L', tcp_table.table[i].dwRemoteAddr)),
+                        "src_port" : socket.ntohs(tcp_table.table[i].dwLocalPort),
+                        "dst_port" : socket.ntohs(tcp_table.table[i].dwRemotePort),
+                        "pid" : tcp_table.table[i].dwOwningPid,
+                        "state" : state_to_string(tcp_table.table[i].dwState),
+                    })
+        return rows
+
+    def find_tcp_row(self, sip, dip, sport, dport):
+        return find_row(self.tcp_rows(), sip, dip, sport, dport)
+
+# Linux tcp_states.h numbering, mapped onto the MIB_TCP_STATE_* values
+PROC_NET_STATES = {
+    1 : MIB_TCP_STATE_ESTAB,
+    2 : MIB_TCP_STATE_SYN_SENT,
+    3 : MIB_TCP_STATE_SYN_RCVD,
+    4 : MIB_TCP_STATE_FIN_WAIT1,
+    5 : MIB_TCP_STATE_FIN_WAIT2,
+    6 : MIB_TCP_STATE_TIME_WAIT,
+    7 : MIB_TCP_STATE_CLOSED,
+    8 : MIB_TCP_STATE_CLOSE_WAIT,
+    9 : MIB_TCP_STATE_LAST_ACK,
+    10 : MIB_TCP_STATE_LISTEN,
+    11 : MIB_TCP_STATE_CLOSING,
+}
+
+# @param address : "0100007F" or a 32 digit IPv6 address, as the kernel
+#                  prints it: 32 bit words in host byte order
+# @return : the address as a string
+def proc_net_address(address):
+    if len(address) == 8:
+        return socket.inet_ntoa(struct.pack("=I", int(address, 16)))
+
+    return socket.inet_ntop(socket.AF_INET6, struct.pack("=4I", *[
+        int(address[i:i+8], 16) for i in range(0, 32, 8)]))
+
+class ProcNetProvider:
+    # Parses whole /proc/net tables at once and finds socket owners with a
+    # single pass over /proc/<pid>/fd per snapshot, instead of asking about
+    # every socket separately as psutil.net_connections does.
+    def __init__(self, root="/proc"):
+        self.root = root
+
+    def __read_table(self, name, addresses, states, ports):
+        # @return : (src_ip, src_port, dst_ip, dst_port, state, inode) for
+        #           every socket in /proc/net/<name>, or only for those
+        #           with both of ports, if given
+        try:
+            with open(os.path.join(self.root, "net", name)) as f:
+                lines = f.read().splitlines()[1:]
+        except OSError:
+            return []
+
+        if ports:
+            # skip parsing lines that cannot match; the kernel prints each
+            # port as four hex digits after its address
+            a, b = [":{:04X} ".format(port) for port in ports]
+            lines = [line for line in lines if a in line and b in line]
+
+        entries = []
+        for line in lines:
+            fields = line.split()
+            local, remote, state, inode = fields[1], fields[2], fields[3], fields[9]
+            src, src_port = local.split(":")
+            dst, dst_port = remote.split(":")
+
+            # most sockets share a handful of addresses, convert each once
+            src_ip = addresses.get(src)
+            if src_ip is None:
+                src_ip = addresses[src] = proc_net_address(src)
+            dst_ip = addresses.get(dst)
+            if dst_ip is None:
+                dst_ip = addresses[dst] = proc_net_address(dst)
+
+            entries.append((src_ip, int(src_port, 16), dst_ip, int(dst_port, 16),
+                            states.get(state, "<UNKNOWN>"), int(inode)))
+        return entries
+
+    # @param inodes : socket inodes to look for
+    # @return : dict of inode -> pid for the inodes that were found
+    def inode_pids(self, inodes):
+        owners = {}
+        wanted = set(inodes)
+        wanted.discard(0)
+        if not wanted:
+            return owners
+
+        for pid in os.listdir(self.root):
+            if not pid.isdigit():
+                continue
+
+            fd_dir = os.path.join(self.root, pid, "fd")
+            try:
+                fds = os.listdir(fd_dir)
+            except OSError:
+                # exited, or not ours to look at
+                continue
+
+            # plain concatenation, os.path.join is measurable at 50k fds
+            fd_dir += "/"
+            for fd in fds:
+                try:
+                    target = os.readlink(fd_dir + fd)
+                except OSError:
+                    continue
+
+                if target.startswith("socket:["):
+                    inode = int(target[8:-1])
+                    if inode in wanted:
+                        owners[inode] = int(pid)
+                        wanted.discard(inode)
+
+            # stop as soon as every socket has an owner
+            if not wanted:
+                break
+        return owners
+
+    def __entries(self, names, ports):
+        addresses = {}
+        # the kernel prints the state as two hex digits
+        states = {"{:02X}".format(state) : state_to_string(mib_state)
+                  for state, mib_state in PROC_NET_STATES.items()}
+
+        entries = []
+        for name in names:
+            entries.extend(self.__read_table(name, addresses, states, ports))
+        return entries
+
+    def __rows(self, entries):
+        owners = self.inode_pids(entry[5] for entry in entries)
+        return [
+            {
+                "src_ip" : src_ip,
+                "dst_ip" : dst_ip,
+                "src_port" : src_port,
+                "dst_port" : dst_port,
+                "pid" : owners.get(inode, 0),
+                "state" : state,
+            }
+            for src_ip, src_port, dst_ip, dst_port, state, inode in entries
+        ]
+
+    # @param names : tables under /proc/net to read, e.g. ["tcp", "tcp6"]
+    def rows(self, names):
+        return self.__rows(self.__entries(names, None))
+
+    def tcp_rows(self):
+        return self.rows(["tcp", "tcp6"])
+
+    # only parses lines with both ports, and looks up the owner of the
+    # matching socket alone rather than of every socket in the table
+    def find_tcp_row(self, sip, dip, sport, dport):
+        for entry in self.__entries(["tcp", "tcp6"], (sport, dport)):
+            src_ip, src_port, dst_ip, dst_port = entry[:4]
+            if (src_ip, src_port, dst_ip, dst_port) in [(sip, sport, dip, dport),
+                                                        (dip, dport, sip, sport)]:
+                return self.__rows([entry])[0]
+
+        return None
+
+# psutil status names, mapped onto the MIB_TCP_STATE_* values
+PSUTIL_STATES = {
+    psutil.CONN_ESTABLISHED : MIB_TCP_STATE_ESTAB,
+    psutil.CONN_SYN_SENT : MIB_TCP_STATE_SYN_SENT,
+    psutil.CONN_SYN_RECV : MIB_TCP_STATE_SYN_RCVD,
+    psutil.CONN_FIN_WAIT1 : MIB_TCP_STATE_FIN_WAIT1,
+    psutil.CONN_FIN_WAIT2 : MIB_TCP_STATE_FIN_WAIT2,
+    psutil.CONN_TIME_WAIT : MIB_TCP_STATE_TIME_WAIT,
+    psutil.CONN_CLOSE : MIB_TCP_STATE_CLOSED,
+    psutil.CONN_CLOSE_WAIT : MIB_TCP_STATE_CLOSE_WAIT,
+    psutil.CONN_LAST_ACK : MIB_TCP_STATE_LAST_ACK,
+    psutil.CONN_LISTEN : MIB_TCP_STATE_LISTEN,
+    psutil.CONN_CLOSING : MIB_TCP_STATE_CLOSING,
+    # psutil.CONN_DELETE_TCB only exists on Windows
+    "DELETE_TCB" : MIB_TCP_STATE_DELETE_TCB,
+}
+
+class PsutilProvider:
+    def rows(self, kind):
+        rows = []
+        for conn in psutil.net_connections(kind=kind):
+            # listening and unconnected sockets have no remote address
+            if conn.raddr:
+                dst_ip, dst_port = conn.raddr
+            elif conn.family == socket.AF_INET6:
+                dst_ip, dst_port = "::", 0
+            else:
+                dst_ip, dst_port = "0.0.0.0", 0
+            rows.append({
+                "src_ip" : conn.laddr[0],
+                "dst_ip" : dst_ip,
+                "src_port" : conn.laddr[1],
+                "dst_port" : dst_port,
+                "pid" : conn.pid or 0,
+                "state" : state_to_string(PSUTIL_STATES.get(conn.status)),
+            })
+        return rows
+
+    def tcp_rows(self):
+        return self.rows("tcp")
+
+    def find_tcp_row(self, sip, dip, sport, dport):
+        return find_row(self.tcp_rows(), sip, dip, sport, dport)
+
+default_provider = None
+
+def get_connection_table_provider():
+    # one provider per process, picked for the platform we run on
+    global default_provider
+    if default_provider is None:
+        if sys.platform == "win32":
+            default_provider = WindowsTcpTableProvider()
+        elif os.path.exists("/proc/net/tcp"):
+            default_provider = ProcNetProvider()
+        else:
+            default_provider = PsutilProvider()
+    return default_provider
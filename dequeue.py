@@ -1,3 +1,7 @@
+import asyncio
+import threading
+import time
+
 # dequeue implemented using doubly linked list
 #
 class DequeueDLList:
@@ -17,6 +21,8 @@ class DequeueDLList:
             
     # definition of a node for the doubly linked list
     class Node:
+        __slots__ = ("item", "next", "prev")
+        
         # initialize val an next
         def __init__(self, item):
             self.item = item
@@ -116,3 +122,331 @@ class DequeueDLList:
     def __iter__(self):
         return self.DequeueDLListIterator(self)
         
+
+# dequeue implemented using a growable circular array
+#
+class DequeueRingBuffer:
+    # iterator for the dequeue
+    class DequeueRingBufferIterator:
+        def __init__(self, dequeueRingBuffer):
+            self.items = dequeueRingBuffer.items
+            self.mask = dequeueRingBuffer.mask
+            self.index = dequeueRingBuffer.head
+            self.end = dequeueRingBuffer.head + dequeueRingBuffer.count
+
+        def __next__(self):
+            if self.index < self.end:
+                item = self.items[self.index & self.mask]
+                self.index += 1
+                return item
+
+            raise StopIteration
+
+    # the capacity is always a power of two so positions can wrap with a
+    # mask instead of a modulo
+    MIN_CAPACITY = 8
+
+    def __init__(self):
+        self.items = [None] * self.MIN_CAPACITY
+        self.mask = self.MIN_CAPACITY - 1
+        self.head = 0
+        self.count = 0
+
+    # @param capacity : move the items into a new array of this size
+    def __resize(self, capacity):
+        items = [None] * capacity
+        n = len(self.items)
+        end = self.head + self.count
+        if end <= n:
+            items[:self.count] = self.items[self.head:end]
+        else:
+            # the items wrap around the end of the array
+            items[:n - self.head] = self.items[self.head:]
+            items[n - self.head:self.count] = self.items[:end - n]
+        self.items = items
+        self.mask = capacity - 1
+        self.head = 0
+
+    # @return : True if the dequeue is empty, otherwise False
+    def isEmpty(self):
+        return self.count == 0
+
+    # @return : length of the dequeue
+    def __len__(self):
+        return self.count
+
+    # @return : the item at position i counted from the front
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.count
+        if i < 0 or i >= self.count:
+            raise IndexError("dequeue index out of range")
+
+        return self.items[(self.head + i) & self.mask]
+
+    # @param item : push the item to the front of the dequeue
+    def pushFront(self, item):
+        if self.count == len(self.items):
+            self.__resize(2 * len(self.items))
+
+        self.head = (self.head - 1) & self.mask
+        self.items[self.head] = item
+        self.count += 1
+
+    # @param item : push the item to the back of the dequeue
+    def push(self, item):
+        if self.count == len(self.items):
+            self.__resize(2 * len(self.items))
+
+        self.items[(self.head + self.count) & self.mask] = item
+        self.count += 1
+
+    # @return : pop an item off the front of the dequeue
+    def popFront(self):
+        count = self.count - 1
+        if count < 0:
+            return None
+
+        head = self.head
+        item = self.items[head]
+        self.items[head] = None
+        self.head = (head + 1) & self.mask
+        self.count = count
+
+        # shrink by half once the dequeue drains to a quarter of its capacity
+        if count <= self.mask >> 2 and self.mask >= self.MIN_CAPACITY:
+            self.__resize((self.mask + 1) >> 1)
+
+        return item
+
+    # @return : pop an item off the back of the dequeue
+    def pop(self):
+        count = self.count - 1
+        if count < 0:
+            return None
+
+        tail = (self.head + count) & self.mask
+        item = self.items[tail]
+        self.items[tail] = None
+        self.count = count
+
+        # shrink by half once the dequeue drains to a quarter of its capacity
+        if count <= self.mask >> 2 and self.mask >= self.MIN_CAPACITY:
+            self.__resize((self.mask + 1) >> 1)
+
+        return item
+
+    # @return : return an iterator for the dequeue object
+    def __iter__(self):
+        return self.DequeueRingBufferIterator(self)
+
+# bounded, thread-safe dequeue for producer/consumer pipelines
+#
+# push and pop block while the dequeue is full or empty, up to an optional
+# timeout in seconds; a timed out push returns False and a timed out pop
+# returns None. Consumers normally take from the front with popFront while
+# idle workers can steal from the back with pop or steal, and the *_many
+# methods move a whole batch under a single acquisition of the lock.
+class BlockingDequeue:
+    # @param capacity : maximum number of items, None for unbounded
+    def __init__(self, capacity=None):
+        self.items = DequeueRingBuffer()
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        self.notEmpty = threading.Condition(self.lock)
+        self.notFull = threading.Condition(self.lock)
+
+    def __isFull(self):
+        return self.capacity is not None and len(self.items) >= self.capacity
+
+    # @return : True if the dequeue is empty, otherwise False
+    def isEmpty(self):
+        with self.lock:
+            return self.items.isEmpty()
+
+    # @return : length of the dequeue
+    def __len__(self):
+        with self.lock:
+            return len(self.items)
+
+    def __push(self, item, front, timeout):
+        with self.notFull:
+            if not self.notFull.wait_for(lambda: not self.__isFull(), timeout):
+                return False
+
+            if front:
+                self.items.pushFront(item)
+            else:
+                self.items.push(item)
+            self.notEmpty.notify()
+            return True
+
+    # @param item : push the item to the back, waiting while full
+    # @return : False if the timeout expired first, otherwise True
+    def push(self, item, timeout=None):
+        return self.__push(item, False, timeout)
+
+    # @param item : push the item to the front, waiting while full
+    # @return : False if the timeout expired first, otherwise True
+    def pushFront(self, item, timeout=None):
+        return self.__push(item, True, timeout)
+
+    def __pop(self, front, timeout):
+        with self.notEmpty:
+            if not self.notEmpty.wait_for(lambda: not self.items.isEmpty(), timeout):
+                return None
+
+            if front:
+                item = self.items.popFront()
+            else:
+                item = self.items.pop()
+            self.notFull.notify()
+            return item
+
+    # @return : pop an item off the front, waiting while empty; None if
+    #           the timeout expired first
+    def popFront(self, timeout=None):
+        return self.__pop(True, timeout)
+
+    # @return : pop an item off the back, waiting while empty; None if the
+    #           timeout expired first
+    def pop(self, timeout=None):
+        return self.__pop(False, timeout)
+
+    # @return : take an item off the back without waiting, or None
+    def steal(self):
+        return self.__pop(False, 0)
+
+    # @param items : push the items to the back in order, waiting for room
+    #                as needed
+    # @return : number of items pushed before the timeout expired
+    def push_many(self, items, timeout=None):
+        items = list(items)
+        pushed = 0
+        if timeout is not None:
+            deadline = time.monotonic() + timeout
+        with self.notFull:
+            while pushed < len(items):
+                if timeout is not None:
+                    timeout = max(0, deadline - time.monotonic())
+                if not self.notFull.wait_for(lambda: not self.__isFull(), timeout):
+                    break
+
+                room = len(items) - pushed
+                if self.capacity is not None:
+                    room = min(room, self.capacity - len(self.items))
+                for item in items[pushed:pushed + room]:
+                    self.items.push(item)
+                pushed += room
+                self.notEmpty.notify(room)
+
+        return pushed
+
+    # @return : up to maxItems items from the front, waiting until at least
+    #           one is available; an empty list if the timeout expired first
+    def pop_many(self, maxItems, timeout=None):
+        with self.notEmpty:
+            if not self.notEmpty.wait_for(lambda: not self.items.isEmpty(), timeout):
+                return []
+
+            batch = []
+            while len(batch) < maxItems and not self.items.isEmpty():
+                batch.append(self.items.popFront())
+            self.notFull.notify(len(batch))
+            return batch
+
+    # @return : iterator over a copy of the items taken under the lock
+    def __iter__(self):
+        with self.lock:
+            return iter(list(self.items))
+
+# bounded dequeue for asyncio coroutines
+#
+# push and pop suspend the calling coroutine while the dequeue is full or
+# empty and are woken as soon as space or an item becomes available. After
+# close() no more items can be pushed; pops keep draining what is left and
+# then return None, and async iteration over the front stops.
+class AsyncDequeue:
+    # @param capacity : maximum number of items, None for unbounded
+    def __init__(self, capacity=None):
+        self.items = DequeueRingBuffer()
+        self.capacity = capacity
+        self.closed = False
+        lock = asyncio.Lock()
+        self.notEmpty = asyncio.Condition(lock)
+        self.notFull = asyncio.Condition(lock)
+
+    def __canPush(self):
+        return self.closed or self.capacity is None or len(self.items) < self.capacity
+
+    def __canPop(self):
+        return self.closed or not self.items.isEmpty()
+
+    # @return : True if the dequeue is empty, otherwise False
+    def isEmpty(self):
+        return self.items.isEmpty()
+
+    # @return : length of the dequeue
+    def __len__(self):
+        return len(self.items)
+
+    async def __push(self, item, front):
+        async with self.notFull:
+            await self.notFull.wait_for(self.__canPush)
+            if self.closed:
+                raise RuntimeError("push to a closed dequeue")
+
+            if front:
+                self.items.pushFront(item)
+            else:
+                self.items.push(item)
+            self.notEmpty.notify()
+
+    # @param item : push the item to the back, waiting while full
+    async def push(self, item):
+        await self.__push(item, False)
+
+    # @param item : push the item to the front, waiting while full
+    async def pushFront(self, item):
+        await self.__push(item, True)
+
+    # @return : (True, item) or (False, None) once closed and drained
+    async def __pop(self, front):
+        async with self.notEmpty:
+            await self.notEmpty.wait_for(self.__canPop)
+            if self.items.isEmpty():
+                return False, None
+
+            if front:
+                item = self.items.popFront()
+            else:
+                item = self.items.pop()
+            self.notFull.notify()
+            return True, item
+
+    # @return : pop an item off the front, waiting while empty; None once
+    #           the dequeue is closed and drained
+    async def popFront(self):
+        return (await self.__pop(True))[1]
+
+    # @return : pop an item off the back, waiting while empty; None once
+    #           the dequeue is closed and drained
+    async def pop(self):
+        return (await self.__pop(False))[1]
+
+    # stop accepting items and wake every waiting coroutine
+    async def close(self):
+        async with self.notEmpty:
+            self.closed = True
+            self.notEmpty.notify_all()
+            self.notFull.notify_all()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        found, item = await self.__pop(True)
+        if not found:
+            raise StopAsyncIteration
+
+        return item
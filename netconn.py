@@ -8,121 +8,150 @@
 #     c.  file SHA256
 #     d.  source address
 #     e.  destination address
+# 4.  Watch the TCP table and print new, closed and changed connections
+#     as JSON lines
 
-from ctypes import *
-import socket
-import struct
 import psutil
 import json
 import hashlib
+import concurrent.futures
 import os
 import sys
+import sqlite3
+import ipaddress
+import threading
+import time
 import pymongo
+from conntable import get_connection_table_provider
+from resolver import close_default_resolver, get_default_resolver
 
 FILENAME_EXCLUSIONS = [
     "firefox.exe",
     "System Idle Process",
 ]
 
+# unspecified (0.0.0.0, ::) and loopback addresses are always excluded too
 IP_EXCLUSIONS = [
     "0.0.0.0",
     "127.0.0.1",
     "172.16.0.154",
 ]
 
+# persistent cache of file hashes, so unchanged files are not rehashed on
+# every scan
+HASH_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".netconn_hash_cache.sqlite")
+HASH_CACHE_MAX_ENTRIES = 100000
+HASH_CHUNK_SIZE = 1024 * 1024
+
+MONGO_URI = "mongodb://localhost:27017/"
+MONGO_DATABASE = "security"
+MONGO_COLLECTION = "gettcptable2"
+# maximum number of destinations per $in query
+MONGO_BATCH_SIZE = 1000
+
+# threads used by get_data to query processes and hash files
+COLLECTION_WORKERS = os.cpu_count() or 1
+
+# seconds between polls of the connection table in WATCH mode
+WATCH_INTERVAL = 5
+
 OUTPUT_NORMAL = 0
 OUTPUT_JSON = 1
 OUTPUT_TABLE = 2
 OUTPUT_DIFF = 3
 OUTPUT_DUMP = 4
 OUTPUT_DROP = 5
+OUTPUT_WATCH = 6
 
-NO_ERROR = 0
-ERROR_INSUFFICIENT_BUFFER = 122
-
-MIB_TCP_STATE_CLOSED = 1
-MIB_TCP_STATE_LISTEN = 2
-MIB_TCP_STATE_SYN_SENT = 3
-MIB_TCP_STATE_SYN_RCVD = 4
-MIB_TCP_STATE_ESTAB = 5
-MIB_TCP_STATE_FIN_WAIT1 = 6
-MIB_TCP_STATE_FIN_WAIT2 = 7
-MIB_TCP_STATE_CLOSE_WAIT = 8
-MIB_TCP_STATE_CLOSING = 9
-MIB_TCP_STATE_LAST_ACK = 10
-MIB_TCP_STATE_TIME_WAIT = 11
-MIB_TCP_STATE_DELETE_TCB = 12
+def is_excluded_ip(ip):
+    if ip in IP_EXCLUSIONS:
+        return True
+    
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return False
+    return address.is_unspecified or address.is_loopback
 
-TcpConnectionOffloadStateInHost = 0
-TcpConnectionOffloadStateOffloading = 1
-TcpConnectionOffloadStateOffloaded = 2
-TcpConnectionOffloadStateUploading = 3
-TcpConnectionOffloadStateMax = 4
+# @return : "ip:port", with IPv6 addresses in brackets so the port can be
+#           told apart
+def format_endpoint(ip, port):
+    if ":" in ip:
+        return "[{}]:{}".format(ip, port)
+    return "{}:{}".format(ip, port)
 
-class MIB_TCPROW2(Structure):
-    _fields_ = [
-        ("dwState", c_ulong),
-        ("dwLocalAddr", c_ulong),
-        ("dwLocalPort", c_ulong),
-        ("dwRemoteAddr", c_ulong),
-        ("dwRemotePort", c_ulong),
-        ("dwOwningPid", c_ulong),
-        ("dwOffloadState", c_ulong),
-    ]
-    
-def MIB_TCPTABLE2_FACTORY(size):
-    class MIB_TCPTABLE2(Structure):
-        _fields_ = [
-            ("dwNumEntries", c_ulong),
-            ("table", MIB_TCPROW2 * size),
-        ]
-    return MIB_TCPTABLE2()
-    
-def state_to_string(state):
-    if state == MIB_TCP_STATE_CLOSED:
-        return "MIB_TCP_STATE_CLOSED"
-    elif state == MIB_TCP_STATE_LISTEN:
-        return "MIB_TCP_STATE_LISTEN"
-    elif state == MIB_TCP_STATE_SYN_SENT:
-        return "MIB_TCP_STATE_SYN_SENT"
-    elif state == MIB_TCP_STATE_SYN_RCVD:
-        return "MIB_TCP_STATE_SYN_RCVD"
-    elif state == MIB_TCP_STATE_ESTAB:
-        return "MIB_TCP_STATE_ESTAB"
-    elif state == MIB_TCP_STATE_FIN_WAIT1:
-        return "MIB_TCP_STATE_FIN_WAIT1"
-    elif state == MIB_TCP_STATE_FIN_WAIT2:
-        return "MIB_TCP_STATE_FIN_WAIT2"
-    elif state == MIB_TCP_STATE_CLOSE_WAIT:
-        return "MIB_TCP_STATE_CLOSE_WAIT"
-    elif state == MIB_TCP_STATE_CLOSING:
-        return "MIB_TCP_STATE_CLOSING"
-    elif state == MIB_TCP_STATE_LAST_ACK:
-        return "MIB_TCP_STATE_LAST_ACK"
-    elif state == MIB_TCP_STATE_TIME_WAIT:
-        return "MIB_TCP_STATE_TIME_WAIT"
-    elif state == MIB_TCP_STATE_DELETE_TCB:
-        return "MIB_TCP_STATE_DELETE_TCB"
-    else:
-        return "<UNKNOWN>"
-        
 def get_sha256_from_path(file_path):
+    # hash in chunks so large files are never held in memory at once
+    sha256 = hashlib.sha256()
     with open(file_path, "rb") as f:
-        contents = f.read()
-        sha256 = hashlib.sha256(contents).hexdigest()
-    return sha256
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
 
-def get_sha256_from_cmd_line(command_line):
-    if not command_line:
-        return "<UNKNOWN>"
-    else:
-        file_path = command_line[0]
-        dir_path = os.path.dirname(file_path)
-        if not dir_path:
-            return "<UNKNOWN>"
-        else:
-            return get_sha256_from_path(file_path)   
+class HashCache:
+    # SHA256 of files keyed by path and validated against the file's
+    # (device, inode, size, mtime), stored in SQLite so it survives
+    # restarts. The least recently used entries beyond max_entries are
+    # evicted on flush().
+    def __init__(self, path=HASH_CACHE_PATH, max_entries=HASH_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS hashes ("
+            "path TEXT PRIMARY KEY, device INTEGER, inode INTEGER, size INTEGER, "
+            "mtime_ns INTEGER, sha256 TEXT, last_used INTEGER)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS hashes_last_used ON hashes (last_used)")
+        self.clock = self.db.execute("SELECT COALESCE(MAX(last_used), 0) FROM hashes").fetchone()[0]
+        # entries looked up since the last flush: path -> (stat key, sha256)
+        self.recent = {}
+        
+    def get_sha256(self, file_path):
+        st = os.stat(file_path)
+        key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+        
+        with self.lock:
+            entry = self.recent.get(file_path)
+            if entry and entry[0] == key:
+                return entry[1]
+            
+            row = self.db.execute(
+                "SELECT device, inode, size, mtime_ns, sha256 FROM hashes WHERE path = ?",
+                (file_path,)).fetchone()
+            if row and tuple(row[:4]) == key:
+                self.recent[file_path] = (key, row[4])
+                return row[4]
+        
+        # hash outside the lock so other threads can use the cache meanwhile
+        sha256 = get_sha256_from_path(file_path)
+        with self.lock:
+            self.recent[file_path] = (key, sha256)
+        return sha256
     
+    # write back the entries used since the last flush and evict the least
+    # recently used ones
+    def flush(self):
+        with self.lock:
+            self.clock += 1
+            self.db.executemany(
+                "INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(path,) + key + (sha256, self.clock) for path, (key, sha256) in self.recent.items()])
+            self.db.execute(
+                "DELETE FROM hashes WHERE path IN ("
+                "SELECT path FROM hashes ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,))
+            self.db.commit()
+            self.recent = {}
+            
+    def close(self):
+        self.flush()
+        self.db.close()
+
+def get_sha256(file_path, hash_cache=None):
+    if hash_cache:
+        return hash_cache.get_sha256(file_path)
+    return get_sha256_from_path(file_path)
+
 def isPE(file_path):
     with open(file_path, "rb") as f:
         contents = f.read(2)
@@ -131,164 +160,439 @@ def isPE(file_path):
         return True
     return False
 
-def get_loaded_modules_list(pid):
-    loaded_modules = []
+def get_module_paths(pid, process=None):
+    # @return : paths of the PE modules loaded by pid, or None if they
+    #           cannot be listed
     try:
-        p = psutil.Process(pid)
-        for dll in p.memory_maps():
-            if isPE(dll.path) and os.path.splitext(dll.path)[1] != ".mui":
-                loaded_modules.append({
-                    "module_path" : dll.path,
-                    "module_sha256" : get_sha256_from_path(dll.path),
-                })
+        p = process or psutil.Process(pid)
+        return [dll.path for dll in p.memory_maps()
+                if isPE(dll.path) and os.path.splitext(dll.path)[1] != ".mui"]
     except:
-        return []
-    return loaded_modules
-    
-def get_data():
-    pid_ip_map = {}
-    
-    windll.iphlpapi.GetTcpTable2.argtypes = [c_void_p, POINTER(c_ulong), c_bool]
-    tcp_table_size = c_ulong()
+        return None
+
+def get_process_info(pid):
+    unknown = {
+        "filename" : "<UNKNOWN>",
+        "cmd_line" : [],
+        "module_paths" : None,
+    }
+    # the process may have exited since the table was read, and pid 0 is
+    # not a real process outside Windows
+    try:
+        p = psutil.Process(pid)
+        # oneshot reads each of the process' status files once for all of
+        # the queries below
+        with p.oneshot():
+            # the name of another user's process is usually readable even
+            # when its command line is not, so each field is denied alone
+            try:
+                filename = p.name()
+            except psutil.AccessDenied:
+                filename = unknown["filename"]
+            try:
+                cmd_line = p.cmdline()
+            except psutil.AccessDenied:
+                cmd_line = unknown["cmd_line"]
+            return {
+                "filename" : filename,
+                "cmd_line" : cmd_line,
+                "module_paths" : get_module_paths(pid, p),
+            }
+    except psutil.Error:
+        # NoSuchProcess from any of the queries, since a record mixing a
+        # dead process with whatever now has its pid would be misleading
+        return unknown
+
+def get_sha256_or_none(file_path, hash_cache=None):
+    try:
+        return get_sha256(file_path, hash_cache)
+    except OSError:
+        return None
+
+# @return : dict of pid -> filename, cmd_line, sha256 and loaded_modules
+#           for every pid in pids
+def get_process_records(pids, hash_cache=None, workers=1):
+    pids = list(pids)
     
-    ret = windll.iphlpapi.GetTcpTable2(None, byref(tcp_table_size), True)
-    if ret == ERROR_INSUFFICIENT_BUFFER:
-        tcp_table = MIB_TCPTABLE2_FACTORY(tcp_table_size.value)
+    # psutil lookups and hashing are mostly system calls and file reads,
+    # which release the GIL, so they overlap well on a thread pool
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        process_info = dict(zip(pids, pool.map(get_process_info, pids)))
         
-        ret = windll.iphlpapi.GetTcpTable2(byref(tcp_table), byref(tcp_table_size), True)
-        if ret != NO_ERROR:
-            print("ERROR: GetTcpTable2() failed, error = " + str(ret))
-        else:
-            for i in range(tcp_table.dwNumEntries):
-                src_ip = socket.inet_ntoa(struct.pack('<L', tcp_table.table[i].dwLocalAddr))
-                dst_ip = socket.inet_ntoa(struct.pack('<L', tcp_table.table[i].dwRemoteAddr))
-                src_port = socket.ntohs(tcp_table.table[i].dwLocalPort)
-                dst_port = socket.ntohs(tcp_table.table[i].dwRemotePort)
-                pid = tcp_table.table[i].dwOwningPid
-                state = state_to_string(tcp_table.table[i].dwState)
-                cmd_line = psutil.Process(pid).cmdline()
-                
-                if pid not in pid_ip_map:
-                    pid_ip_map[pid] = {
-                        "filename" : psutil.Process(pid).name(),
-                        "cmd_line" : cmd_line,
-                        "sha256" : get_sha256_from_cmd_line(cmd_line),
-                        "loaded_modules" : get_loaded_modules_list(pid),
-                        "connections" : [
-                            {
-                                "src" : src_ip + ":" + str(src_port),
-                                "dst" : dst_ip + ":" + str(dst_port),
-                                "dst_name" : socket.getnameinfo((dst_ip, 0), 0)[0],
-                                "state" : state,
-                            }
-                        ]
-                    }
-                else:
-                    pid_ip_map[pid]["connections"].append(
-                        {
-                            "src" : src_ip + ":" + str(src_port),
-                            "dst" : dst_ip + ":" + str(dst_port),
-                            "dst_name" : socket.getnameinfo((dst_ip, 0), 0)[0],
-                            "state" : state,
-                        }
-                    )
-    return pid_ip_map
+        # hash every distinct file once, however many processes load it
+        file_paths = set()
+        for info in process_info.values():
+            cmd_line = info["cmd_line"]
+            if cmd_line and os.path.dirname(cmd_line[0]):
+                file_paths.add(cmd_line[0])
+            file_paths.update(info["module_paths"] or [])
+        
+        file_paths = list(file_paths)
+        sha256s = dict(zip(file_paths, pool.map(
+            lambda file_path: get_sha256_or_none(file_path, hash_cache), file_paths)))
     
-def is_dst_in_table(col, dst):
-    found = False
+    records = {}
+    for pid, info in process_info.items():
+        cmd_line = info["cmd_line"]
+        
+        sha256 = "<UNKNOWN>"
+        if cmd_line and os.path.dirname(cmd_line[0]):
+            sha256 = sha256s[cmd_line[0]] or "<UNKNOWN>"
+        
+        # a module that cannot be read empties the whole list
+        loaded_modules = [
+            {
+                "module_path" : path,
+                "module_sha256" : sha256s[path],
+            }
+            for path in info["module_paths"] or []
+        ]
+        if any(module["module_sha256"] is None for module in loaded_modules):
+            loaded_modules = []
+        
+        records[pid] = {
+            "filename" : info["filename"],
+            "cmd_line" : cmd_line,
+            "sha256" : sha256,
+            "loaded_modules" : loaded_modules,
+        }
+    return records
+
+def get_create_time(pid):
+    # @return : start time of pid, which tells a reused pid apart from the
+    #           process that had it before; 0 if it cannot be read
     try:
-        items = col.find({"dst" : dst})
-        if items[0]:
-            found = True
-    except IndexError:
-        pass
-    return found
+        return psutil.Process(pid).create_time()
+    except psutil.Error:
+        return 0
+
+class ProcessCache:
+    # records from get_process_records, built once per process and reused
+    # by every scan, output format and watch cycle. Entries are keyed by
+    # pid and checked against the process' create time, so a reused pid
+    # gets a fresh record, and are evicted once their process exits.
+    def __init__(self):
+        # pid -> (create_time, record)
+        self.entries = {}
+        self.lock = threading.Lock()
     
-def save_to_table(pid_ip_map):
-    client = pymongo.MongoClient("mongodb://localhost:27017/")
-    db = client["security"]
-    col = db["gettcptable2"]
+    def __len__(self):
+        return len(self.entries)
     
-    for pid in pid_ip_map:
-        filename = pid_ip_map[pid]["filename"]
-        if filename not in FILENAME_EXCLUSIONS:
-            for conn in pid_ip_map[pid]["connections"]:
-                dst = conn["dst"]
-                found = is_dst_in_table(col, dst)
-                if not found and dst.split(":")[0] not in IP_EXCLUSIONS:
-                    x = col.insert_one({"dst" : dst})
-                    print("DB: {}".format(dst))
+    # @param create_times : dict of pid -> create time, if already known
+    # @return : dict of pid -> record for every pid in pids
+    def get_records(self, pids, hash_cache=None, workers=1, create_times=None):
+        pids = list(pids)
+        if create_times is None:
+            create_times = {pid : get_create_time(pid) for pid in pids}
+        
+        with self.lock:
+            self.evict_exited()
+            missing = [pid for pid in pids
+                       if pid not in self.entries or self.entries[pid][0] != create_times[pid]]
+        
+        if missing:
+            records = get_process_records(missing, hash_cache, workers)
+            with self.lock:
+                for pid in missing:
+                    self.entries[pid] = (create_times[pid], records[pid])
+        
+        with self.lock:
+            return {pid : self.entries[pid][1] for pid in pids}
     
-def output_diff_dst(pid_ip_map):
-    client = pymongo.MongoClient("mongodb://localhost:27017/")
-    db = client["security"]
-    col = db["gettcptable2"]
+    def evict_exited(self):
+        live = set(psutil.pids())
+        # pid 0 also stands for sockets without a visible owner, keep its
+        # placeholder record even where psutil does not list it
+        live.add(0)
+        for pid in [pid for pid in self.entries if pid not in live]:
+            del self.entries[pid]
+
+process_cache = None
+
+def get_process_cache():
+    # one cache per process, shared by get_data and ConnectionWatcher
+    global process_cache
+    if process_cache is None:
+        process_cache = ProcessCache()
+    return process_cache
+
+def get_data(hash_cache=None, workers=1, resolver=None, provider=None, process_cache=None):
+    resolver = resolver or get_default_resolver()
+    provider = provider or get_connection_table_provider()
+    # an empty cache is falsy, so test for None explicitly
+    if process_cache is None:
+        process_cache = get_process_cache()
+    pid_ip_map = {}
+    rows = provider.tcp_rows()
     
-    for pid in pid_ip_map:
-        filename = pid_ip_map[pid]["filename"]
-        if filename not in FILENAME_EXCLUSIONS:
-            for conn in pid_ip_map[pid]["connections"]:
-                dst = conn["dst"]
-                found = is_dst_in_table(col, dst)
-                if not found and dst.split(":")[0] not in IP_EXCLUSIONS:
-                    name_info = socket.getnameinfo((dst.split(":")[0], 0), 0)[0]
-                    print("DIFF: {:20} {}".format(dst, name_info))
+    # start the reverse lookups now so they overlap with the process work
+    dst_ips = [row["dst_ip"] for row in rows]
+    for dst_ip in set(dst_ips):
+        resolver.submit(dst_ip)
+    pids = list(dict.fromkeys(row["pid"] for row in rows))
     
-def dump_table():
-    client = pymongo.MongoClient("mongodb://localhost:27017/")
-    db = client["security"]
-    col = db["gettcptable2"]
+    records = process_cache.get_records(pids, hash_cache, workers)
+    dst_names = resolver.resolve_many(dst_ips)
     
-    for row in col.find():
-        print(row)
+    for row in rows:
+        pid = row["pid"]
+        if pid not in pid_ip_map:
+            pid_ip_map[pid] = dict(records[pid], connections=[])
+        
+        pid_ip_map[pid]["connections"].append(
+            {
+                "src" : format_endpoint(row["src_ip"], row["src_port"]),
+                "dst" : format_endpoint(row["dst_ip"], row["dst_port"]),
+                "dst_ip" : row["dst_ip"],
+                "dst_name" : dst_names[row["dst_ip"]],
+                "state" : row["state"],
+            }
+        )
+    return pid_ip_map
+
+class ConnectionWatcher:
+    # Polls the connection table and reports only what changed since the
+    # previous poll. Connections are keyed by their owner's (pid,
+    # create_time) and their 4-tuple, and processes are only enriched
+    # (command line, hashes, modules) the first time they are seen, so a
+    # steady state poll costs one table read and one create time per pid.
+    def __init__(self, hash_cache=None, workers=1, resolver=None, provider=None,
+                 process_cache=None):
+        self.hash_cache = hash_cache
+        self.workers = workers
+        self.resolver = resolver or get_default_resolver()
+        self.provider = provider or get_connection_table_provider()
+        if process_cache is None:
+            process_cache = get_process_cache()
+        self.process_cache = process_cache
+        # (pid, create_time, src_ip, src_port, dst_ip, dst_port) -> event
+        # last reported for that connection
+        self.connections = {}
+    
+    def __event(self, event, key, row, dst_name, record):
+        pid, create_time = key[:2]
+        return {
+            "event" : event,
+            "pid" : pid,
+            "create_time" : create_time,
+            "filename" : record["filename"],
+            "cmd_line" : record["cmd_line"],
+            "sha256" : record["sha256"],
+            "src" : format_endpoint(row["src_ip"], row["src_port"]),
+            "dst" : format_endpoint(row["dst_ip"], row["dst_port"]),
+            "dst_ip" : row["dst_ip"],
+            "dst_name" : dst_name,
+            "state" : row["state"],
+        }
     
-def drop_table():
-    client = pymongo.MongoClient("mongodb://localhost:27017/")
-    db = client["security"]
-    col = db["gettcptable2"]
-    col.drop()
+    # @return : list of new, closed and changed connection events
+    def poll(self):
+        rows = self.provider.tcp_rows()
+        create_times = {pid : get_create_time(pid) for pid in set(row["pid"] for row in rows)}
+        
+        current = {}
+        for row in rows:
+            pid = row["pid"]
+            key = (pid, create_times[pid],
+                   row["src_ip"], row["src_port"], row["dst_ip"], row["dst_port"])
+            current[key] = row
+        
+        opened = [key for key in current if key not in self.connections]
+        records = self.process_cache.get_records(
+            create_times, self.hash_cache, self.workers, create_times)
+        
+        dst_names = self.resolver.resolve_many(current[key]["dst_ip"] for key in opened)
+        
+        # closes first, so a socket that changes owner reads as closed
+        # and then new
+        events = []
+        for key, previous in self.connections.items():
+            if key not in current:
+                event = dict(previous, event="closed")
+                event.pop("previous_state", None)
+                events.append(event)
         
-def main(output_type):
-    if output_type == OUTPUT_DUMP:
-        dump_table()
-        return
+        connections = {}
+        for key, row in current.items():
+            previous = self.connections.get(key)
+            if previous is None:
+                event = self.__event("new", key, row, dst_names[row["dst_ip"]],
+                                     records[key[0]])
+                events.append(event)
+            elif previous["state"] != row["state"]:
+                event = self.__event("changed", key, row, previous["dst_name"],
+                                     records[key[0]])
+                event["previous_state"] = previous["state"]
+                events.append(event)
+            else:
+                event = previous
+            connections[key] = event
+        
+        self.connections = connections
+        return events
     
-    if output_type == OUTPUT_DROP:
-        drop_table()
-        return
+    # print the events of every poll as JSON lines until interrupted
+    def watch(self, interval=WATCH_INTERVAL, out=sys.stdout):
+        while True:
+            start = time.monotonic()
+            for event in self.poll():
+                out.write(json.dumps(event) + "\n")
+            out.flush()
+            if self.hash_cache:
+                self.hash_cache.flush()
+            time.sleep(max(0, interval - (time.monotonic() - start)))
     
-    pid_ip_map = get_data()
+class ConnectionStore:
+    # destinations seen so far, kept in MongoDB with a unique index on dst.
+    # Lookups and writes are batched so a scan costs a handful of round
+    # trips instead of one or two per connection.
+    def __init__(self, client=None):
+        if client is None:
+            client = pymongo.MongoClient(MONGO_URI)
+        self.client = client
+        self.col = client[MONGO_DATABASE][MONGO_COLLECTION]
+        self.col.create_index("dst", unique=True)
+        
+    # @return : the subset of dsts already stored
+    def known_dsts(self, dsts):
+        dsts = list(dsts)
+        known = set()
+        for i in range(0, len(dsts), MONGO_BATCH_SIZE):
+            batch = dsts[i:i + MONGO_BATCH_SIZE]
+            for row in self.col.find({"dst" : {"$in" : batch}}, {"dst" : 1, "_id" : 0}):
+                known.add(row["dst"])
+        return known
     
-    # print out the TCP connections
-    if output_type == OUTPUT_NORMAL:
+    # @return : dict of dst -> dst_ip for the destinations in pid_ip_map
+    #           that are not excluded and not stored yet, in the order they
+    #           were first seen
+    def new_dsts(self, pid_ip_map):
+        dsts = {}
         for pid in pid_ip_map:
-            print("PID: " + str(pid))
-            print("Process Name: " + psutil.Process(pid).name())
-            print("SHA256: " + pid_ip_map[pid]["sha256"])
-            for c in pid_ip_map[pid]["connections"]:
-                print("{:10}{:25}{:10}{:25}{:15}{:50}{:10}{:25}".format(
-                    "SRC: ", c.get("src"), 
-                    "DST: ", c.get("dst"),
-                    "DST_NAME: ", c.get("dst_name"),
-                    "STATE: ", c.get("state")))
-            print()
-        return
+            filename = pid_ip_map[pid]["filename"]
+            if filename not in FILENAME_EXCLUSIONS:
+                for conn in pid_ip_map[pid]["connections"]:
+                    if not is_excluded_ip(conn["dst_ip"]):
+                        dsts[conn["dst"]] = conn["dst_ip"]
         
-    if output_type == OUTPUT_JSON:
-        print(json.dumps(pid_ip_map, indent=4))
-        return
+        known = self.known_dsts(dsts)
+        return {dst : dst_ip for dst, dst_ip in dsts.items() if dst not in known}
+    
+    # @param dsts : dict of dst -> dst_ip, as returned by new_dsts
+    def save(self, dsts):
+        if not dsts:
+            return
         
-    if output_type == OUTPUT_TABLE:
-        save_to_table(pid_ip_map)
-        return
+        # upserts keep this idempotent if another scan stored a dst since
+        # it was looked up
+        self.col.bulk_write(
+            [pymongo.UpdateOne({"dst" : dst},
+                               {"$setOnInsert" : {"dst" : dst, "dst_ip" : dst_ip}},
+                               upsert=True)
+             for dst, dst_ip in dsts.items()],
+            ordered=False)
         
-    if output_type == OUTPUT_DIFF:
-        output_diff_dst(pid_ip_map)
-        return
+    def dump(self):
+        return self.col.find()
     
+    def drop(self):
+        self.col.drop()
+        self.col.create_index("dst", unique=True)
+
+connection_store = None
+
+def get_connection_store():
+    # one store, and so one pooled client, per process
+    global connection_store
+    if connection_store is None:
+        connection_store = ConnectionStore()
+    return connection_store
+
+def save_to_table(pid_ip_map, store=None):
+    store = store or get_connection_store()
+    dsts = store.new_dsts(pid_ip_map)
+    store.save(dsts)
+    for dst in dsts:
+        print("DB: {}".format(dst))
+    
+def output_diff_dst(pid_ip_map, store=None, resolver=None):
+    store = store or get_connection_store()
+    resolver = resolver or get_default_resolver()
+    dsts = store.new_dsts(pid_ip_map)
+    names = resolver.resolve_many(dsts.values())
+    for dst, dst_ip in dsts.items():
+        print("DIFF: {:20} {}".format(dst, names[dst_ip]))
+    
+def dump_table(store=None):
+    store = store or get_connection_store()
+    for row in store.dump():
+        print(row)
+    
+def drop_table(store=None):
+    store = store or get_connection_store()
+    store.drop()
+        
+def main(output_type, interval=WATCH_INTERVAL):
+    try:
+        if output_type == OUTPUT_DUMP:
+            dump_table()
+            return
+        
+        if output_type == OUTPUT_DROP:
+            drop_table()
+            return
+        
+        if output_type == OUTPUT_WATCH:
+            hash_cache = HashCache()
+            try:
+                ConnectionWatcher(hash_cache, COLLECTION_WORKERS).watch(interval)
+            except KeyboardInterrupt:
+                pass
+            finally:
+                hash_cache.close()
+            return
+        
+        hash_cache = HashCache()
+        try:
+            pid_ip_map = get_data(hash_cache, COLLECTION_WORKERS)
+        finally:
+            hash_cache.close()
+        
+        # print out the TCP connections
+        if output_type == OUTPUT_NORMAL:
+            for pid in pid_ip_map:
+                print("PID: " + str(pid))
+                print("Process Name: " + pid_ip_map[pid]["filename"])
+                print("SHA256: " + pid_ip_map[pid]["sha256"])
+                for c in pid_ip_map[pid]["connections"]:
+                    print("{:10}{:25}{:10}{:25}{:15}{:50}{:10}{:25}".format(
+                        "SRC: ", c.get("src"), 
+                        "DST: ", c.get("dst"),
+                        "DST_NAME: ", c.get("dst_name"),
+                        "STATE: ", c.get("state")))
+                print()
+            return
+            
+        if output_type == OUTPUT_JSON:
+            print(json.dumps(pid_ip_map, indent=4))
+            return
+            
+        if output_type == OUTPUT_TABLE:
+            save_to_table(pid_ip_map)
+            return
+            
+        if output_type == OUTPUT_DIFF:
+            output_diff_dst(pid_ip_map)
+            return
+    finally:
+        # the resolver's lookup threads would otherwise hold up exit
+        close_default_resolver()
+
 if __name__ == "__main__":
     output_type = OUTPUT_NORMAL
-    if len(sys.argv) == 2:
+    interval = WATCH_INTERVAL
+    if len(sys.argv) >= 2:
         if sys.argv[1] == "JSON":
             output_type = OUTPUT_JSON
         elif sys.argv[1] == "DB":
@@ -299,4 +603,8 @@ if __name__ == "__main__":
             output_type = OUTPUT_DUMP
         elif sys.argv[1] == "DROP":
             output_type = OUTPUT_DROP
-    main(output_type)
+        elif sys.argv[1] == "WATCH":
+            output_type = OUTPUT_WATCH
+            if len(sys.argv) == 3:
+                interval = float(sys.argv[2])
+    main(output_type, interval)
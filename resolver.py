@@ -0,0 +1,129 @@
+# Cached, concurrent reverse DNS lookups shared by netconn.py and sniff.py
+#
+# socket.getnameinfo blocks for the full resolver timeout on addresses
+# without a PTR record. ReverseResolver runs lookups on a thread pool,
+# shares one lookup between every caller asking for the same address,
+# caches answers for RESOLVER_TTL seconds and failures for
+# RESOLVER_NEGATIVE_TTL seconds, and never makes a caller wait longer than
+# its deadline. An address that has no name, or whose lookup has not
+# finished in time, resolves to itself, as getnameinfo does. Expired
+# answers are purged as lookups come in, so a long-running caller only
+# keeps the addresses it has seen recently.
+import concurrent.futures
+import socket
+import threading
+import time
+
+RESOLVER_WORKERS = 16
+RESOLVER_TTL = 300
+RESOLVER_NEGATIVE_TTL = 60
+RESOLVER_TIMEOUT = 2.0
+
+class ReverseResolver:
+    def __init__(self, workers=RESOLVER_WORKERS, ttl=RESOLVER_TTL,
+                 negative_ttl=RESOLVER_NEGATIVE_TTL, timeout=RESOLVER_TIMEOUT):
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        # ip -> (name or None, expiry time)
+        self.cache = {}
+        # ip -> future of a lookup in flight
+        self.pending = {}
+        self.next_purge = time.monotonic() + min(ttl, negative_ttl)
+
+    def __lookup(self, ip):
+        try:
+            name = socket.getnameinfo((ip, 0), socket.NI_NAMEREQD)[0]
+        except (socket.gaierror, socket.herror, OSError):
+            name = None
+
+        ttl = self.ttl if name else self.negative_ttl
+        with self.lock:
+            self.cache[ip] = (name, time.monotonic() + ttl)
+            self.pending.pop(ip, None)
+        return name
+
+    def __purge(self, now):
+        # drop expired answers, at most once per shortest ttl so the cost
+        # stays proportional to the lookups made; called with lock held
+        if now < self.next_purge:
+            return
+        
+        self.cache = {ip : entry for ip, entry in self.cache.items() if entry[1] > now}
+        self.next_purge = now + min(self.ttl, self.negative_ttl)
+
+    # @return : a future for the name of ip, starting a lookup only if the
+    #           answer is not cached or already being looked up
+    def submit(self, ip):
+        with self.lock:
+            now = time.monotonic()
+            self.__purge(now)
+            entry = self.cache.get(ip)
+            if entry and entry[1] > now:
+                future = concurrent.futures.Future()
+                future.set_result(entry[0])
+                return future
+
+            future = self.pending.get(ip)
+            if future is None:
+                future = self.pool.submit(self.__lookup, ip)
+                self.pending[ip] = future
+            return future
+
+    # @return : the name of ip, or ip itself if it has none or the lookup
+    #           takes longer than timeout seconds
+    def resolve(self, ip, timeout=None):
+        if timeout is None:
+            timeout = self.timeout
+
+        try:
+            return self.submit(ip).result(timeout) or ip
+        except concurrent.futures.TimeoutError:
+            return ip
+
+    # @return : dict of ip -> name for every ip, resolved concurrently so
+    #           the wait is bounded by the slowest single lookup
+    def resolve_many(self, ips, timeout=None):
+        if timeout is None:
+            timeout = self.timeout
+
+        futures = {ip : self.submit(ip) for ip in set(ips)}
+        concurrent.futures.wait(futures.values(), timeout)
+
+        names = {}
+        for ip, future in futures.items():
+            # lookups cancelled by close() count as unanswered
+            name = future.result() if future.done() and not future.cancelled() else None
+            names[ip] = name or ip
+        return names
+
+    # @return : the cached name of ip, or None if it is not known yet; a
+    #           lookup is started in the background so a later call can
+    #           answer without blocking
+    def lookup_nowait(self, ip):
+        future = self.submit(ip)
+        if future.done() and not future.cancelled():
+            return future.result() or ip
+        return None
+
+    # drop queued lookups so the pool's threads do not keep the process
+    # alive at exit; a lookup already running still finishes
+    def close(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+default_resolver = None
+
+def get_default_resolver():
+    # one resolver, and so one cache, per process
+    global default_resolver
+    if default_resolver is None:
+        default_resolver = ReverseResolver()
+    return default_resolver
+
+def close_default_resolver():
+    global default_resolver
+    if default_resolver is not None:
+        default_resolver.close()
+        default_resolver = None
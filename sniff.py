@@ -1,71 +1,49 @@
 from scapy.all import *
-from ctypes import *
-import socket
-import struct
 import psutil
+import time
+from conntable import get_connection_table_provider
+from resolver import close_default_resolver, get_default_resolver
 
-NO_ERROR = 0
-ERROR_INSUFFICIENT_BUFFER = 122
-ERROR_NOT_FOUND = 1168
+# packets of one connection keep arriving, so remember who owns it for a
+# while instead of searching the connection table for every packet
+FLOW_CACHE_TTL = 30
+FLOW_CACHE_MAX_ENTRIES = 10000
 
+# (endpoint, endpoint) in sorted order -> (process name, pid, expiry time)
+flow_cache = {}
+
+def find_process_name(sip, dip, sport, dport):
+    row = get_connection_table_provider().find_tcp_row(sip, dip, sport, dport)
+    if row is None:
+        return None
     
-class MIB_TCPROW2(Structure):
-    _fields_ = [
-        ("dwState", c_ulong),
-        ("dwLocalAddr", c_ulong),
-        ("dwLocalPort", c_ulong),
-        ("dwRemoteAddr", c_ulong),
-        ("dwRemotePort", c_ulong),
-        ("dwOwningPid", c_ulong),
-        ("dwOffloadState", c_ulong),
-    ]
-    
-def MIB_TCPTABLE2_FACTORY(size):
-    class MIB_TCPTABLE2(Structure):
-        _fields_ = [
-            ("dwNumEntries", c_ulong),
-            ("table", MIB_TCPROW2 * size),
-        ]
-    return MIB_TCPTABLE2()
-    
+    pid = row["pid"]
+    if pid == 4:
+        return "System", pid
     
+    try:
+        return psutil.Process(pid).name(), pid
+    except psutil.NoSuchProcess:
+        return "<UNKNOWN>", pid
+
 def get_process_name(sip, dip, sport, dport):
-    windll.iphlpapi.GetTcpTable2.argtypes = [c_void_p, POINTER(c_ulong), c_bool]
-    tcp_table_size = c_ulong()
-    pid = -1
+    global flow_cache
+    key = tuple(sorted([(sip, sport), (dip, dport)]))
+    now = time.monotonic()
     
-    ret = windll.iphlpapi.GetTcpTable2(None, byref(tcp_table_size), True)
-    if ret == ERROR_INSUFFICIENT_BUFFER:
-        tcp_table = MIB_TCPTABLE2_FACTORY(tcp_table_size.value)
-        
-        ret = windll.iphlpapi.GetTcpTable2(byref(tcp_table), byref(tcp_table_size), True)
-        if ret == NO_ERROR:
-            for i in range(tcp_table.dwNumEntries):
-                pid = tcp_table.table[i].dwOwningPid
-                src_ip = socket.inet_ntoa(struct.pack('<L', tcp_table.table[i].dwLocalAddr))
-                dst_ip = socket.inet_ntoa(struct.pack('<L', tcp_table.table[i].dwRemoteAddr))
-                src_port = socket.ntohs(tcp_table.table[i].dwLocalPort)
-                dst_port = socket.ntohs(tcp_table.table[i].dwRemotePort)
-                if src_port == sport and dst_port == dport and src_ip == sip and dst_ip == dip:
-                    if pid == 4:
-                        return "System", pid
-                    else:
-                        try:
-                            return psutil.Process(pid).name(), pid
-                        except psutil.NoSuchProcess:
-                            return "<UNKNOWN>", pid
-                elif src_port == dport and dst_port == sport and src_ip == dip and dst_ip == sip:
-                    if pid == 4:
-                        return "System", pid
-                    else:
-                        try:
-                            return psutil.Process(pid).name(), pid
-                        except psutil.NoSuchProcess:
-                            return "<UNKNOWN>", pid
+    entry = flow_cache.get(key)
+    if entry and entry[2] > now:
+        return entry[0], entry[1]
     
-    if pid == 4:
-        return "System", pid
-    return "<UNKNOWN>", pid
+    found = find_process_name(sip, dip, sport, dport)
+    if found is None:
+        # not cached, the connection may show up in the table shortly
+        return "<UNKNOWN>", -1
+    
+    if len(flow_cache) >= FLOW_CACHE_MAX_ENTRIES:
+        flow_cache = {k : e for k, e in flow_cache.items() if e[2] > now}
+    flow_cache[key] = (found[0], found[1], now + FLOW_CACHE_TTL)
+    return found
     
 def on_packet(pkt):
     protocol = []
@@ -101,6 +79,11 @@ def on_packet(pkt):
         
     if "UDP" not in protocol:
         process_name, pid = get_process_name(src_ip, dst_ip, src_port, dst_port)
+        
+        if not name and dst_ip:
+            # never block the capture loop on DNS; the name shows up on
+            # later packets once the lookup has finished
+            name = get_default_resolver().lookup_nowait(dst_ip) or ""
     
         print("{:10}{:30}{:6}{:10}{:10}{:20}{:9}{:10}{:10}{:20}{:9}{:10}{:8}{:50}{:8}{:10}".format(
             "PROCESS:", process_name, 
@@ -117,7 +100,10 @@ def on_packet(pkt):
     
     
 def main():
-    sniff(filter="ip and tcp and udp and dns", prn=on_packet)
+    try:
+        sniff(filter="ip and tcp and udp and dns", prn=on_packet)
+    finally:
+        close_default_resolver()
     
 
 if __name__ == "__main__":
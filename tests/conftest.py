@@ -0,0 +1,13 @@
+import importlib.util
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# 2DTree.py is not a valid module name, so load it from its path
+def load_tree2d():
+    spec = importlib.util.spec_from_file_location("Tree2D", os.path.join(ROOT, "2DTree.py"))
+    tree2d = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(tree2d)
+    return tree2d
@@ -0,0 +1,233 @@
+import copy
+import random
+
+import pytest
+
+from conftest import load_tree2d
+
+tree2d = load_tree2d()
+Point2D = tree2d.Point2D
+RectHV = tree2d.RectHV
+Tree2D = tree2d.Tree2D
+StaticTree2D = tree2d.StaticTree2D
+
+needs_numpy = pytest.mark.skipif(tree2d.np is None, reason="StaticTree2D needs numpy")
+
+def random_points(rng, n):
+    return [Point2D(rng.uniform(0, 8), rng.uniform(0, 8)) for i in range(n)]
+
+def duplicate_points(rng, n):
+    # few distinct coordinates, so many points coincide or share an x or y
+    return [Point2D(rng.randrange(8), rng.randrange(8)) for i in range(n)]
+
+def build_inserted(points):
+    tree = Tree2D()
+    for p in points:
+        tree.insert(p)
+    return tree
+
+def random_rect(rng):
+    # integer bounds too, so rectangle edges land exactly on points
+    if rng.random() < 0.5:
+        x0, x1 = sorted(rng.randrange(-1, 9) for i in range(2))
+        y0, y1 = sorted(rng.randrange(-1, 9) for i in range(2))
+    else:
+        x0, x1 = sorted(rng.uniform(-1, 9) for i in range(2))
+        y0, y1 = sorted(rng.uniform(-1, 9) for i in range(2))
+    return RectHV(x0, y0, x1, y1)
+
+def brute_force_distance(points, q):
+    return min(p.distanceSquaredTo(q) for p in points)
+
+@pytest.mark.parametrize("make_points", [random_points, duplicate_points])
+@pytest.mark.parametrize("build", [build_inserted, Tree2D.from_points])
+def test_nearest_matches_linear_scan(make_points, build):
+    rng = random.Random(17)
+    for n in [1, 2, 10, 500]:
+        points = make_points(rng, n)
+        tree = build(points)
+        for i in range(200):
+            q = Point2D(rng.uniform(-1, 9), rng.uniform(-1, 9))
+            # ties may return any of the closest points, so compare distances
+            assert tree.nearest(q).distanceSquaredTo(q) == brute_force_distance(points, q)
+
+@pytest.mark.parametrize("make_points", [random_points, duplicate_points])
+def test_nearest_after_deletes(make_points):
+    rng = random.Random(17)
+    points = make_points(rng, 500)
+    tree = Tree2D.from_points(points)
+    for p in points[:300]:
+        tree.delete(p)
+    # each delete removes one copy of a duplicated point
+    remaining = points[300:]
+    for i in range(200):
+        q = Point2D(rng.uniform(-1, 9), rng.uniform(-1, 9))
+        assert tree.nearest(q).distanceSquaredTo(q) == brute_force_distance(remaining, q)
+
+@pytest.mark.parametrize("make_points", [random_points, duplicate_points])
+def test_knearest_matches_linear_scan(make_points):
+    rng = random.Random(17)
+    points = make_points(rng, 300)
+    tree = Tree2D.from_points(points)
+    for k in [1, 5, 50, 300, 400]:
+        for i in range(50):
+            q = Point2D(rng.uniform(-1, 9), rng.uniform(-1, 9))
+            expected = sorted(p.distanceSquaredTo(q) for p in points)[:k]
+            found = tree.knearest(q, k)
+            # nearest first; ties may pick any of the equally close points
+            assert [p.distanceSquaredTo(q) for p in found] == expected
+    assert tree.knearest(Point2D(0, 0), 0) == []
+
+@pytest.mark.parametrize("make_points", [random_points, duplicate_points])
+def test_within_matches_linear_scan(make_points):
+    rng = random.Random(17)
+    points = make_points(rng, 300)
+    tree = Tree2D.from_points(points)
+    for r in [0, 0.05, 0.3, 2, 20]:
+        for i in range(50):
+            q = Point2D(rng.uniform(-1, 9), rng.uniform(-1, 9))
+            expected = sorted(p for p in points if p.distanceSquaredTo(q) <= r*r)
+            assert sorted(tree.within(q, r)) == expected
+
+@pytest.mark.parametrize("make_points", [random_points, duplicate_points])
+@pytest.mark.parametrize("build", [build_inserted, Tree2D.from_points])
+def test_range_and_count_match_linear_scan(make_points, build):
+    rng = random.Random(17)
+    points = make_points(rng, 400)
+    tree = build(points)
+    for i in range(200):
+        r = random_rect(rng)
+        expected = sorted(p for p in points if r.contains(p))
+        assert sorted(tree.iter_range(r)) == expected
+        assert sorted(tree.range(r)) == expected
+        assert tree.count_range(r) == len(expected)
+    
+    # tombstones must not be reported or counted
+    for p in points[:250]:
+        tree.delete(p)
+    remaining = points[250:]
+    for i in range(200):
+        r = random_rect(rng)
+        expected = sorted(p for p in remaining if r.contains(p))
+        assert sorted(tree.iter_range(r)) == expected
+        assert tree.count_range(r) == len(expected)
+    assert tree.size() == len(remaining)
+
+def depth(tree):
+    deepest = 0
+    stack = [(tree.root, 1)] if tree.root else []
+    while stack:
+        node, d = stack.pop()
+        deepest = max(deepest, d)
+        for child in (node.left, node.right):
+            if child:
+                stack.append((child, d + 1))
+    return deepest
+
+@pytest.mark.parametrize("build", [build_inserted, Tree2D.from_points])
+def test_coincident_points_stay_balanced(build):
+    rng = random.Random(17)
+    # a stationary object reporting the same fix over and over
+    points = [Point2D(1, 1)] * 5000 + [Point2D(rng.randrange(3), rng.randrange(3)) for i in range(3000)]
+    rng.shuffle(points)
+    tree = build(points)
+    assert depth(tree) <= 2 * len(points).bit_length() + 2
+    assert tree.size() == len(points)
+    assert tree.count_range(RectHV(1, 1, 1, 1)) == sum(p == Point2D(1, 1) for p in points)
+    assert tree.contains(Point2D(1, 1))
+    assert not tree.contains(Point2D(5, 5))
+    
+    # deleting goes through the same rebuild
+    remaining = list(points)
+    for i in range(6000):
+        p = remaining.pop(rng.randrange(len(remaining)))
+        assert tree.delete(p)
+    assert depth(tree) <= 2 * len(points).bit_length() + 2
+    assert tree.size() == len(remaining)
+    for x in range(3):
+        for y in range(3):
+            r = RectHV(x, y, x, y)
+            assert tree.count_range(r) == sum(p == Point2D(x, y) for p in remaining)
+            assert len(tree.range(r)) == tree.count_range(r)
+            assert tree.contains(Point2D(x, y)) == (Point2D(x, y) in remaining)
+    assert sorted(tree.within(Point2D(1, 1), 1.5)) == sorted(remaining)
+    
+    for p in remaining:
+        assert tree.delete(p)
+    assert tree.size() == 0
+    assert not tree.delete(Point2D(1, 1))
+
+def test_nearest_of_empty_tree():
+    assert Tree2D().nearest(Point2D(0, 0)) is None
+
+def test_point_is_immutable():
+    p = Point2D(1, 2)
+    points = {p: "a"}
+    with pytest.raises(AttributeError):
+        p.x = 3
+    with pytest.raises(AttributeError):
+        del p.y
+    assert points[Point2D(1, 2)] == "a"
+    
+    for clone in [copy.copy(p), copy.deepcopy(p)]:
+        assert clone == p and hash(clone) == hash(p)
+        with pytest.raises(AttributeError):
+            clone.x = 3
+    
+    tree = build_inserted([Point2D(1, 2), Point2D(3, 4), Point2D(3, 4)])
+    clone = copy.deepcopy(tree)
+    assert clone.size() == 3
+    assert clone.contains(Point2D(3, 4))
+
+# sizes around LEAF_SIZE, so trees with and without inner nodes are covered
+STATIC_SIZES = [0, 1, 31, 32, 33, 500, 2000]
+
+@needs_numpy
+@pytest.mark.parametrize("make_points", [random_points, duplicate_points])
+def test_static_tree_matches_linear_scan(make_points):
+    rng = random.Random(17)
+    for n in STATIC_SIZES:
+        points = make_points(rng, n)
+        tree = StaticTree2D.from_points(points)
+        assert tree.size() == n
+        
+        for i in range(100):
+            q = Point2D(rng.uniform(-1, 9), rng.uniform(-1, 9))
+            if n:
+                assert tree.nearest(q).distanceSquaredTo(q) == brute_force_distance(points, q)
+            else:
+                assert tree.nearest(q) is None
+            
+            r = random_rect(rng)
+            assert sorted(tree.range(r)) == sorted(p for p in points if r.contains(p))
+        
+        for p in points[:50]:
+            assert tree.contains(p)
+        for i in range(50):
+            q = Point2D(rng.randrange(-1, 9) + rng.choice([0, 0.5]), rng.randrange(-1, 9))
+            assert tree.contains(q) == (q in points)
+
+@needs_numpy
+@pytest.mark.parametrize("make_points", [random_points, duplicate_points])
+def test_batched_queries_match_single_queries(make_points):
+    rng = random.Random(17)
+    for n in STATIC_SIZES:
+        points = make_points(rng, n)
+        tree = StaticTree2D.from_points(points)
+        
+        qs = [Point2D(rng.uniform(-1, 9), rng.uniform(-1, 9)) for i in range(300)]
+        found = tree.nearest_many([q.x for q in qs], [q.y for q in qs])
+        assert len(found) == len(qs)
+        for q, i in zip(qs, found):
+            if n:
+                # indices refer to the input order
+                assert points[i].distanceSquaredTo(q) == brute_force_distance(points, q)
+            else:
+                assert i == -1
+        
+        rects = [random_rect(rng) for i in range(300)]
+        for rect_input in [rects, [(r.xMin, r.yMin, r.xMax, r.yMax) for r in rects]]:
+            results = tree.range_many(rect_input)
+            assert len(results) == len(rects)
+            for r, indices in zip(rects, results):
+                assert sorted(indices) == [i for i, p in enumerate(points) if r.contains(p)]
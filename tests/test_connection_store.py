@@ -0,0 +1,108 @@
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+pymongo = pytest.importorskip("pymongo")
+
+import netconn
+
+class FakeResolver:
+    def resolve_many(self, ips, timeout=None):
+        return {ip : "host-" + ip for ip in ips}
+
+def connection(dst):
+    # dst is (ip, port)
+    return {
+        "src" : "10.0.0.1:50000",
+        "dst" : netconn.format_endpoint(*dst),
+        "dst_ip" : dst[0],
+        "dst_name" : "",
+        "state" : "MIB_TCP_STATE_ESTAB",
+    }
+
+def process(filename, dsts):
+    return {
+        "filename" : filename,
+        "cmd_line" : [],
+        "sha256" : "<UNKNOWN>",
+        "loaded_modules" : [],
+        "connections" : [connection(dst) for dst in dsts],
+    }
+
+@pytest.fixture
+def store():
+    return netconn.ConnectionStore(mongomock.MongoClient())
+
+def stored(store):
+    return sorted(row["dst"] for row in store.dump())
+
+def saved(*dsts):
+    return {dst : dst.rsplit(":", 1)[0] for dst in dsts}
+
+def test_exclusions(store):
+    pid_ip_map = {
+        1 : process("firefox.exe", [("93.184.216.34", 443)]),
+        2 : process("curl.exe", [("127.0.0.1", 8080), ("0.0.0.0", 0), ("93.184.216.35", 443)]),
+    }
+    assert store.new_dsts(pid_ip_map) == {"93.184.216.35:443" : "93.184.216.35"}
+
+def test_ipv6_destinations(store, capsys):
+    pid_ip_map = {
+        1 : process("a.exe", [("::", 0), ("::1", 8080), ("2001:db8::1", 443)]),
+    }
+    netconn.save_to_table(pid_ip_map, store)
+    assert stored(store) == ["[2001:db8::1]:443"]
+    assert store.col.find_one({})["dst_ip"] == "2001:db8::1"
+    
+    pid_ip_map[1]["connections"].append(connection(("2001:db8::2", 443)))
+    netconn.output_diff_dst(pid_ip_map, store, FakeResolver())
+    assert capsys.readouterr().out.splitlines()[-1].split() == [
+        "DIFF:", "[2001:db8::2]:443", "host-2001:db8::2"]
+
+def test_duplicate_destinations_are_saved_once(store, capsys):
+    pid_ip_map = {
+        1 : process("a.exe", [("93.184.216.34", 443), ("93.184.216.34", 443)]),
+        2 : process("b.exe", [("93.184.216.34", 443), ("93.184.216.35", 80)]),
+    }
+    netconn.save_to_table(pid_ip_map, store)
+    assert stored(store) == ["93.184.216.34:443", "93.184.216.35:80"]
+    assert capsys.readouterr().out.splitlines() == [
+        "DB: 93.184.216.34:443",
+        "DB: 93.184.216.35:80",
+    ]
+
+def test_repeated_saves(store, capsys):
+    pid_ip_map = {1 : process("a.exe", [("93.184.216.34", 443)])}
+    netconn.save_to_table(pid_ip_map, store)
+    netconn.save_to_table(pid_ip_map, store)
+    store.save(saved("93.184.216.34:443"))
+    assert stored(store) == ["93.184.216.34:443"]
+    assert capsys.readouterr().out.splitlines() == ["DB: 93.184.216.34:443"]
+
+def test_lookups_are_batched(store, monkeypatch):
+    monkeypatch.setattr(netconn, "MONGO_BATCH_SIZE", 3)
+    dsts = ["10.1.0.{}:443".format(i) for i in range(10)]
+    store.save(saved(*dsts[:5]))
+    assert store.known_dsts(dsts) == set(dsts[:5])
+
+def test_diff(store, capsys):
+    store.save(saved("93.184.216.34:443"))
+    pid_ip_map = {1 : process("a.exe", [("93.184.216.34", 443), ("93.184.216.35", 80)])}
+    netconn.output_diff_dst(pid_ip_map, store, FakeResolver())
+    out = capsys.readouterr().out.splitlines()
+    assert len(out) == 1
+    assert out[0].split() == ["DIFF:", "93.184.216.35:80", "host-93.184.216.35"]
+    # diff does not store anything
+    assert stored(store) == ["93.184.216.34:443"]
+
+def test_dump_and_drop(store, capsys):
+    store.save(saved("93.184.216.34:443", "93.184.216.35:80"))
+    netconn.dump_table(store)
+    assert len(capsys.readouterr().out.splitlines()) == 2
+    
+    netconn.drop_table(store)
+    assert stored(store) == []
+    
+    # the unique index comes back with the collection
+    store.save(saved("93.184.216.34:443"))
+    with pytest.raises(pymongo.errors.DuplicateKeyError):
+        store.col.insert_one({"dst" : "93.184.216.34:443"})
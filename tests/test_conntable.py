@@ -0,0 +1,61 @@
+import os
+import socket
+
+import pytest
+
+import conntable
+
+needs_proc_net = pytest.mark.skipif(not os.path.exists("/proc/net/tcp"),
+                                    reason="needs /proc/net")
+
+def test_proc_net_address():
+    assert conntable.proc_net_address("0100007F") == "127.0.0.1"
+    assert conntable.proc_net_address("00000000000000000000000001000000") == "::1"
+    assert conntable.proc_net_address("0000000000000000FFFF00000100007F") == "::ffff:127.0.0.1"
+
+def test_find_row():
+    rows = [
+        {"src_ip" : "10.0.0.1", "dst_ip" : "10.0.0.2", "src_port" : 1, "dst_port" : 2},
+        {"src_ip" : "10.0.0.1", "dst_ip" : "10.0.0.3", "src_port" : 1, "dst_port" : 3},
+    ]
+    assert conntable.find_row(rows, "10.0.0.1", "10.0.0.3", 1, 3) is rows[1]
+    assert conntable.find_row(rows, "10.0.0.3", "10.0.0.1", 3, 1) is rows[1]
+    assert conntable.find_row(rows, "10.0.0.1", "10.0.0.3", 1, 2) is None
+
+@pytest.fixture
+def connected():
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(1)
+    client = socket.create_connection(listener.getsockname())
+    server = listener.accept()[0]
+    yield client
+    for s in [client, server, listener]:
+        s.close()
+
+def key(row):
+    return (row["src_ip"], row["src_port"], row["dst_ip"], row["dst_port"], row["pid"], row["state"])
+
+@needs_proc_net
+def test_proc_net_matches_psutil(connected):
+    # only our own sockets, the rest of the host may change between reads
+    def own(rows):
+        return set(key(row) for row in rows if row["pid"] == os.getpid())
+    
+    proc_net = own(conntable.ProcNetProvider().tcp_rows())
+    assert own(conntable.PsutilProvider().tcp_rows()) == proc_net
+    
+    src, dst = connected.getsockname(), connected.getpeername()
+    assert (src[0], src[1], dst[0], dst[1], os.getpid(), "MIB_TCP_STATE_ESTAB") in proc_net
+
+@needs_proc_net
+def test_find_tcp_row(connected):
+    src, dst = connected.getsockname(), connected.getpeername()
+    for provider in [conntable.ProcNetProvider(), conntable.PsutilProvider()]:
+        row = provider.find_tcp_row(src[0], dst[0], src[1], dst[1])
+        # on loopback both ends are in the table, either may be returned
+        assert {(row["src_ip"], row["src_port"]), (row["dst_ip"], row["dst_port"])} == \
+            {src[:2], dst[:2]}
+        assert row["pid"] == os.getpid()
+        assert provider.find_tcp_row(dst[0], src[0], dst[1], src[1]) is not None
+        assert provider.find_tcp_row("192.0.2.1", "192.0.2.2", 1, 2) is None
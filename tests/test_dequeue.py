@@ -0,0 +1,129 @@
+import asyncio
+import threading
+
+import pytest
+
+from dequeue import AsyncDequeue, BlockingDequeue
+
+def test_producers_and_consumers_lose_nothing():
+    dq = BlockingDequeue(capacity=4)
+    producers = 4
+    perProducer = 2000
+    consumed = []
+    consumedLock = threading.Lock()
+    
+    def produce(start):
+        items = range(start, start + perProducer)
+        half = perProducer // 2
+        for item in items[:half]:
+            if item % 2:
+                assert dq.push(item)
+            else:
+                assert dq.pushFront(item)
+        assert dq.push_many(items[half:]) == perProducer - half
+    
+    done = object()
+    
+    def stealOrPopFront():
+        item = dq.steal()
+        return dq.popFront() if item is None else item
+    
+    def consume(pop):
+        while True:
+            item = pop()
+            # one marker per consumer ends the input
+            if item is done:
+                return
+            with consumedLock:
+                consumed.append(item)
+    
+    consumers = [threading.Thread(target=consume, args=(pop,))
+                 for pop in [dq.popFront, dq.pop, stealOrPopFront]]
+    threads = [threading.Thread(target=produce, args=(i * perProducer,)) for i in range(producers)]
+    for t in consumers + threads:
+        t.start()
+    for t in threads:
+        t.join()
+    for t in consumers:
+        dq.push(done)
+    for t in consumers:
+        t.join()
+    
+    assert sorted(consumed) == list(range(producers * perProducer))
+    assert dq.isEmpty()
+
+def test_timeouts():
+    dq = BlockingDequeue(capacity=2)
+    assert dq.popFront(timeout=0.01) is None
+    assert dq.pop(timeout=0.01) is None
+    assert dq.pop_many(5, timeout=0.01) == []
+    assert dq.steal() is None
+    
+    assert dq.push(1, timeout=0.01)
+    assert dq.pushFront(0, timeout=0.01)
+    assert not dq.push(2, timeout=0.01)
+    assert not dq.pushFront(2, timeout=0.01)
+    assert list(dq) == [0, 1]
+
+def test_push_many_stops_at_the_timeout():
+    dq = BlockingDequeue(capacity=3)
+    assert dq.push_many(range(5), timeout=0.01) == 3
+    assert list(dq) == [0, 1, 2]
+    
+    assert dq.pop_many(2) == [0, 1]
+    assert dq.push_many(range(3, 10), timeout=0.01) == 2
+    assert list(dq) == [2, 3, 4]
+
+def test_steal_takes_from_the_back_without_waiting():
+    dq = BlockingDequeue()
+    dq.push_many([1, 2, 3])
+    assert dq.steal() == 3
+    assert dq.popFront() == 1
+    assert dq.steal() == 2
+    assert dq.steal() is None
+    assert len(dq) == 0
+
+def test_async_iteration_ends_after_close():
+    async def run():
+        dq = AsyncDequeue(capacity=2)
+        received = []
+        
+        async def consume():
+            async for item in dq:
+                received.append(item)
+        
+        consumer = asyncio.create_task(consume())
+        for item in range(10):
+            if item % 2:
+                await dq.push(item)
+            else:
+                await dq.pushFront(item)
+        await dq.close()
+        await asyncio.wait_for(consumer, 1)
+        
+        assert sorted(received) == list(range(10))
+        assert await dq.popFront() is None
+        assert await dq.pop() is None
+        with pytest.raises(RuntimeError):
+            await dq.push(10)
+        with pytest.raises(RuntimeError):
+            await dq.pushFront(10)
+    
+    asyncio.run(run())
+
+def test_async_close_wakes_waiting_pushers():
+    async def run():
+        dq = AsyncDequeue(capacity=1)
+        await dq.push(1)
+        blocked = asyncio.create_task(dq.push(2))
+        await asyncio.sleep(0)
+        assert not blocked.done()
+        
+        await dq.close()
+        with pytest.raises(RuntimeError):
+            await asyncio.wait_for(blocked, 1)
+        # items pushed before close() are still drained
+        assert await dq.pop() == 1
+        assert await dq.pop() is None
+    
+    asyncio.run(run())
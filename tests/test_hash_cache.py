@@ -0,0 +1,91 @@
+import hashlib
+import os
+
+import pytest
+
+import netconn
+
+@pytest.fixture
+def hashed(monkeypatch):
+    # records every file that is actually read and hashed
+    paths = []
+    def get_sha256_from_path(file_path):
+        paths.append(file_path)
+        with open(file_path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    monkeypatch.setattr(netconn, "get_sha256_from_path", get_sha256_from_path)
+    return paths
+
+def write(path, data):
+    path.write_bytes(data)
+    return str(path)
+
+def cached_paths(cache):
+    return {row[0] for row in cache.db.execute("SELECT path FROM hashes")}
+
+def test_hit_after_reopening(tmp_path, hashed):
+    db = str(tmp_path / "hashes.db")
+    a = write(tmp_path / "a", b"aaaa")
+    
+    cache = netconn.HashCache(db)
+    assert cache.get_sha256(a) == hashlib.sha256(b"aaaa").hexdigest()
+    assert cache.get_sha256(a) == hashlib.sha256(b"aaaa").hexdigest()
+    cache.close()
+    assert hashed == [a]
+    
+    cache = netconn.HashCache(db)
+    assert cache.get_sha256(a) == hashlib.sha256(b"aaaa").hexdigest()
+    cache.close()
+    assert hashed == [a]
+
+def test_rehash_after_size_or_mtime_change(tmp_path, hashed):
+    cache = netconn.HashCache(str(tmp_path / "hashes.db"))
+    a = write(tmp_path / "a", b"aaaa")
+    cache.get_sha256(a)
+    cache.flush()
+    
+    # same size, only the mtime moves
+    write(tmp_path / "a", b"bbbb")
+    st = os.stat(a)
+    os.utime(a, ns=(st.st_atime_ns, st.st_mtime_ns + 1000000000))
+    assert cache.get_sha256(a) == hashlib.sha256(b"bbbb").hexdigest()
+    cache.flush()
+    
+    # same mtime, only the size moves
+    st = os.stat(a)
+    write(tmp_path / "a", b"ccccc")
+    os.utime(a, ns=(st.st_atime_ns, st.st_mtime_ns))
+    assert cache.get_sha256(a) == hashlib.sha256(b"ccccc").hexdigest()
+    cache.close()
+    assert hashed == [a, a, a]
+
+def test_flush_evicts_least_recently_used(tmp_path, hashed):
+    cache = netconn.HashCache(str(tmp_path / "hashes.db"), max_entries=2)
+    a, b, c = [write(tmp_path / name, name.encode()) for name in "abc"]
+    
+    for path in [a, b]:
+        cache.get_sha256(path)
+        cache.flush()
+    # a is used again, so b is now the least recently used
+    cache.get_sha256(a)
+    cache.flush()
+    cache.get_sha256(c)
+    cache.flush()
+    assert cached_paths(cache) == {a, c}
+    
+    cache.get_sha256(b)
+    cache.close()
+    assert hashed == [a, b, c, b]
+
+def test_sha256_or_none_of_missing_and_unreadable_files(tmp_path):
+    missing = str(tmp_path / "missing")
+    directory = str(tmp_path)
+    assert netconn.get_sha256_or_none(missing) is None
+    assert netconn.get_sha256_or_none(directory) is None
+    
+    cache = netconn.HashCache(str(tmp_path / "hashes.db"))
+    assert netconn.get_sha256_or_none(missing, cache) is None
+    assert netconn.get_sha256_or_none(directory, cache) is None
+    cache.flush()
+    assert cached_paths(cache) == set()
+    cache.close()
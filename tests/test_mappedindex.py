@@ -0,0 +1,60 @@
+import random
+
+import pytest
+
+from MappedIndex import MappedIndex, write_index
+from RBTree import RBTree
+
+def random_key(rng, keyFormat):
+    if keyFormat == "ii":
+        return (rng.randrange(-20, 20), rng.randrange(-20, 20))
+    return rng.randrange(-1000, 1000)
+
+@pytest.mark.parametrize("keyFormat", ["q", "ii"])
+@pytest.mark.parametrize("n", [0, 1, 300])
+def test_index_matches_tree(tmp_path, keyFormat, n):
+    rng = random.Random(17)
+    bst = RBTree()
+    while bst.size() < n:
+        bst.put(random_key(rng, keyFormat), rng.randrange(1, 1000))
+    
+    path = str(tmp_path / "index")
+    assert write_index(path, bst, keyFormat, "q") == n
+    
+    with MappedIndex(path) as index:
+        assert index.size() == len(index) == n
+        assert index.min() == bst.min()
+        assert index.max() == bst.max()
+        assert list(index) == list(bst.items())
+        assert list(reversed(index)) == list(bst.items(reverse=True))
+        
+        for i in range(-1, n + 1):
+            assert index.select(i) == bst.select(i)
+        
+        for i in range(500):
+            key = random_key(rng, keyFormat)
+            assert index.get(key) == bst.get(key)
+            assert index.floor(key) == bst.floor(key)
+            assert index.ceiling(key) == bst.ceiling(key)
+            assert index.rank(key) == bst.rank(key)
+            
+            lo, hi = sorted([key, random_key(rng, keyFormat)])
+            assert index.rangeCount(lo, hi) == bst.rangeCount(lo, hi)
+            for reverse in [False, True]:
+                assert list(index.keys(lo, hi, reverse)) == list(bst.keys(lo, hi, reverse))
+                assert list(index.items(lo, hi, reverse)) == list(bst.items(lo, hi, reverse))
+                assert list(index.items(lo, None, reverse)) == list(bst.items(lo, None, reverse))
+                assert list(index.items(None, hi, reverse)) == list(bst.items(None, hi, reverse))
+
+def test_rejects_unsorted_items_and_other_files(tmp_path):
+    class Unsorted:
+        def items(self):
+            return iter([(2, 0), (1, 0)])
+    
+    with pytest.raises(ValueError):
+        write_index(str(tmp_path / "index"), Unsorted())
+    
+    path = tmp_path / "other"
+    path.write_bytes(bytes(64))
+    with pytest.raises(ValueError):
+        MappedIndex(str(path))
@@ -0,0 +1,151 @@
+# conformance tests shared by the ordered maps, checked against a dict and
+# a sorted list of its keys
+from bisect import bisect_left, bisect_right
+import random
+
+import pytest
+
+from RBTree import RBTree
+from SortedBlockList import SortedBlockList
+
+class SmallBlockList(SortedBlockList):
+    # tiny blocks so splits and merges happen with few keys
+    BLOCK_SIZE = 8
+
+IMPLEMENTATIONS = [RBTree, SortedBlockList, SmallBlockList]
+
+KEY_RANGE = 2000
+
+def check(bst, model):
+    keys = sorted(model)
+    assert bst.size() == len(keys)
+    assert list(bst.keys()) == keys
+    assert list(bst.items()) == [(key, model[key]) for key in keys]
+    assert list(bst.keys(reverse=True)) == keys[::-1]
+    assert [item[:2] for item in reversed(bst)] == [(key, model[key]) for key in reversed(keys)]
+    assert [item[:2] for item in bst] == [(key, model[key]) for key in keys]
+    
+    if keys:
+        assert bst.min() == model[keys[0]]
+        assert bst.max() == model[keys[-1]]
+    else:
+        assert bst.min() is None
+        assert bst.max() is None
+    
+    for i in range(len(keys)):
+        assert bst.select(i) == keys[i]
+    assert bst.select(-1) is None
+    assert bst.select(len(keys)) is None
+
+def check_queries(bst, model, rng):
+    keys = sorted(model)
+    for i in range(100):
+        key = rng.randrange(-10, KEY_RANGE + 10)
+        assert bst.get(key) == model.get(key)
+        
+        i = bisect_right(keys, key)
+        assert bst.floor(key) == (keys[i-1] if i else None)
+        i = bisect_left(keys, key)
+        assert bst.ceiling(key) == (keys[i] if i < len(keys) else None)
+        assert bst.rank(key) == bisect_left(keys, key)
+        
+        lo, hi = sorted((key, rng.randrange(-10, KEY_RANGE + 10)))
+        expected = keys[bisect_left(keys, lo):bisect_right(keys, hi)]
+        assert bst.rangeCount(lo, hi) == len(expected)
+        assert list(bst.keys(lo, hi)) == expected
+        assert list(bst.keys(lo, hi, reverse=True)) == expected[::-1]
+        assert list(bst.items(lo, hi)) == [(k, model[k]) for k in expected]
+        assert list(bst.keys(lo, None)) == keys[bisect_left(keys, lo):]
+        assert list(bst.keys(None, hi)) == keys[:bisect_right(keys, hi)]
+
+@pytest.fixture(params=IMPLEMENTATIONS, ids=lambda cls: cls.__name__)
+def cls(request):
+    return request.param
+
+def test_empty(cls):
+    bst = cls()
+    check(bst, {})
+    assert bst.get(1) is None
+    assert bst.floor(1) is None
+    assert bst.ceiling(1) is None
+    assert bst.rank(1) == 0
+    assert bst.rangeCount(0, 10) == 0
+    bst.delete(1)
+    bst.deleteMin()
+    bst.deleteMax()
+    check(bst, {})
+
+@pytest.mark.parametrize("order", ["random", "ascending", "descending"])
+def test_put_and_query(cls, order):
+    rng = random.Random(17)
+    keys = rng.sample(range(KEY_RANGE), 600)
+    if order == "ascending":
+        keys.sort()
+    elif order == "descending":
+        keys.sort(reverse=True)
+    
+    bst = cls()
+    model = {}
+    for key in keys:
+        bst.put(key, str(key))
+        model[key] = str(key)
+    check(bst, model)
+    check_queries(bst, model, rng)
+    
+    # overwriting keeps the size and replaces the value
+    for key in keys[:100]:
+        bst.put(key, "new")
+        model[key] = "new"
+    check(bst, model)
+
+def test_deletes(cls):
+    rng = random.Random(17)
+    bst = cls()
+    model = {}
+    for key in rng.sample(range(KEY_RANGE), 600):
+        bst.put(key, str(key))
+        model[key] = str(key)
+    
+    for i in range(50):
+        bst.deleteMin()
+        del model[min(model)]
+        bst.deleteMax()
+        del model[max(model)]
+    check(bst, model)
+    
+    for key in rng.sample(range(KEY_RANGE), 800):
+        bst.delete(key)
+        model.pop(key, None)
+    check(bst, model)
+    check_queries(bst, model, rng)
+    
+    for key in list(model):
+        bst.delete(key)
+    check(bst, {})
+
+def test_random_operations(cls):
+    rng = random.Random(17)
+    bst = cls()
+    model = {}
+    for step in range(3000):
+        op = rng.random()
+        key = rng.randrange(KEY_RANGE // 4)
+        if op < 0.5:
+            bst.put(key, step)
+            model[key] = step
+        elif op < 0.8:
+            bst.delete(key)
+            model.pop(key, None)
+        elif op < 0.9:
+            bst.deleteMin()
+            if model:
+                del model[min(model)]
+        else:
+            bst.deleteMax()
+            if model:
+                del model[max(model)]
+        
+        if step % 500 == 0:
+            check(bst, model)
+    check(bst, model)
+    check_queries(bst, model, rng)
@@ -0,0 +1,135 @@
+import psutil
+import pytest
+
+import netconn
+
+class FakeProcess:
+    # psutil.Process stand-in whose queries raise the configured errors
+    errors = {}
+    
+    def __init__(self, pid):
+        self.pid = pid
+        if "init" in self.errors:
+            raise self.errors["init"](pid)
+    
+    def oneshot(self):
+        return self
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        pass
+    
+    def __query(self, name, value):
+        if name in self.errors:
+            raise self.errors[name](self.pid)
+        return value
+    
+    def name(self):
+        return self.__query("name", "app")
+    
+    def cmdline(self):
+        return self.__query("cmdline", ["/usr/bin/app", "--flag"])
+    
+    def memory_maps(self):
+        return self.__query("memory_maps", [])
+
+@pytest.fixture
+def process(monkeypatch):
+    monkeypatch.setattr(psutil, "Process", FakeProcess)
+    monkeypatch.setattr(FakeProcess, "errors", {})
+    return FakeProcess
+
+def test_process_info_of_readable_process(process):
+    assert netconn.get_process_info(1) == {
+        "filename" : "app",
+        "cmd_line" : ["/usr/bin/app", "--flag"],
+        "module_paths" : [],
+    }
+
+def test_denied_fields_fall_back_alone(process):
+    process.errors = {"cmdline" : psutil.AccessDenied, "memory_maps" : psutil.AccessDenied}
+    assert netconn.get_process_info(1) == {
+        "filename" : "app",
+        "cmd_line" : [],
+        "module_paths" : None,
+    }
+    
+    process.errors = {"name" : psutil.AccessDenied}
+    assert netconn.get_process_info(1) == {
+        "filename" : "<UNKNOWN>",
+        "cmd_line" : ["/usr/bin/app", "--flag"],
+        "module_paths" : [],
+    }
+
+@pytest.mark.parametrize("query", ["init", "name", "cmdline"])
+def test_exited_process_is_unknown(process, query):
+    process.errors = {query : psutil.NoSuchProcess}
+    assert netconn.get_process_info(1) == {
+        "filename" : "<UNKNOWN>",
+        "cmd_line" : [],
+        "module_paths" : None,
+    }
+
+@pytest.fixture
+def built(monkeypatch):
+    # pids whose records were built, and the live pids evict_exited sees
+    pids = []
+    live = set()
+    def get_process_records(missing, hash_cache=None, workers=1):
+        pids.extend(missing)
+        return {pid : {"pid" : pid, "build" : len(pids)} for pid in missing}
+    monkeypatch.setattr(netconn, "get_process_records", get_process_records)
+    monkeypatch.setattr(psutil, "pids", lambda: sorted(live))
+    return pids, live
+
+def test_reused_pid_gets_a_fresh_record(built):
+    pids, live = built
+    live.update([1, 2])
+    cache = netconn.ProcessCache()
+    
+    first = cache.get_records([1, 2], create_times={1 : 10.0, 2 : 20.0})
+    assert cache.get_records([1, 2], create_times={1 : 10.0, 2 : 20.0}) == first
+    assert pids == [1, 2]
+    
+    # pid 2 now belongs to a process started later
+    second = cache.get_records([1, 2], create_times={1 : 10.0, 2 : 25.0})
+    assert pids == [1, 2, 2]
+    assert second[1] == first[1]
+    assert second[2] != first[2]
+
+def test_exited_pids_are_evicted(built):
+    pids, live = built
+    live.update([1, 2, 3])
+    cache = netconn.ProcessCache()
+    cache.get_records([1, 2, 3], create_times={1 : 10.0, 2 : 20.0, 3 : 30.0})
+    cache.get_records([0], create_times={0 : 0})
+    assert len(cache) == 4
+    
+    live.discard(2)
+    live.discard(3)
+    cache.get_records([1], create_times={1 : 10.0})
+    # pid 0 is kept even though psutil does not list it
+    assert sorted(cache.entries) == [0, 1]
+    assert pids == [1, 2, 3, 0]
+
+def test_empty_cache_passed_in_is_used(built, monkeypatch):
+    monkeypatch.setattr(netconn, "process_cache", None)
+    
+    class Provider:
+        def tcp_rows(self):
+            return []
+    class Resolver:
+        def submit(self, ip):
+            pass
+        def resolve_many(self, ips, timeout=None):
+            return {}
+    
+    cache = netconn.ProcessCache()
+    watcher = netconn.ConnectionWatcher(resolver=Resolver(), provider=Provider(),
+                                        process_cache=cache)
+    assert watcher.process_cache is cache
+    
+    netconn.get_data(resolver=Resolver(), provider=Provider(), process_cache=cache)
+    assert netconn.process_cache is None
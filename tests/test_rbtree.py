@@ -0,0 +1,33 @@
+import random
+
+from RBTree import RBTree
+
+def test_snapshot_is_unaffected_by_later_writes():
+    rng = random.Random(17)
+    bst = RBTree(persistent=True)
+    for key in rng.sample(range(1000), 200):
+        bst.put(key, key)
+    
+    view = bst.snapshot()
+    before = list(view.items())
+    for key in rng.sample(range(1000), 200):
+        bst.put(key, -key)
+    for key in rng.sample(range(1000), 100):
+        bst.delete(key)
+    
+    assert list(view.items()) == before
+
+def test_from_sorted_and_merge_keep_persistence():
+    items = [(i, i) for i in range(50)]
+    assert RBTree.from_sorted(items, persistent=True).persistent
+    assert not RBTree.from_sorted(items).persistent
+    
+    bst = RBTree.from_sorted(items, persistent=True)
+    other = RBTree.from_sorted([(i, -i) for i in range(25, 75)])
+    merged = bst.merge(other)
+    assert merged.persistent
+    
+    view = merged.snapshot()
+    merged.put(100, 100)
+    assert list(view.keys()) == list(range(75))
+    assert view.get(30) == -30
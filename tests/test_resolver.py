@@ -0,0 +1,55 @@
+import socket
+import threading
+import time
+
+from resolver import ReverseResolver
+
+def test_cached_answer_is_reused():
+    resolver = ReverseResolver(ttl=60, negative_ttl=60)
+    try:
+        resolver.cache["192.0.2.1"] = ("example.test", time.monotonic() + 60)
+        assert resolver.resolve("192.0.2.1") == "example.test"
+        assert resolver.lookup_nowait("192.0.2.1") == "example.test"
+        assert not resolver.pending
+    finally:
+        resolver.close()
+
+def test_expired_entries_are_purged():
+    resolver = ReverseResolver(ttl=60, negative_ttl=60)
+    try:
+        now = time.monotonic()
+        for i in range(100):
+            resolver.cache["192.0.2.{}".format(i)] = (None, now - 1)
+        resolver.cache["192.0.2.200"] = ("example.test", now + 60)
+        
+        # not due yet, so nothing is dropped
+        resolver.submit("192.0.2.200")
+        assert len(resolver.cache) == 101
+        
+        resolver.next_purge = now
+        resolver.submit("192.0.2.200")
+        assert list(resolver.cache) == ["192.0.2.200"]
+    finally:
+        resolver.close()
+
+def test_close_cancels_queued_lookups(monkeypatch):
+    started = threading.Event()
+    release = threading.Event()
+    def getnameinfo(address, flags):
+        started.set()
+        release.wait(5)
+        raise socket.herror()
+    monkeypatch.setattr(socket, "getnameinfo", getnameinfo)
+    
+    resolver = ReverseResolver(workers=1)
+    running = resolver.submit("192.0.2.1")
+    queued = resolver.submit("192.0.2.2")
+    assert started.wait(5)
+    
+    resolver.close()
+    assert queued.cancelled()
+    assert resolver.resolve_many(["192.0.2.2"], timeout=0) == {"192.0.2.2" : "192.0.2.2"}
+    assert resolver.lookup_nowait("192.0.2.2") is None
+    
+    release.set()
+    assert running.result(5) is None
@@ -0,0 +1,58 @@
+import os
+
+import netconn
+
+class FakeProvider:
+    def __init__(self):
+        self.rows = []
+    
+    def tcp_rows(self):
+        return list(self.rows)
+
+class FakeResolver:
+    def resolve_many(self, ips, timeout=None):
+        return {ip : "host-" + ip for ip in ips}
+
+def row(src_port, state, pid=None):
+    return {
+        "src_ip" : "10.0.0.1",
+        "dst_ip" : "10.0.0.2",
+        "src_port" : src_port,
+        "dst_port" : 443,
+        "pid" : os.getpid() if pid is None else pid,
+        "state" : state,
+    }
+
+def summary(events):
+    return [(e["event"], e["src"], e["state"], e.get("previous_state"), e["pid"]) for e in events]
+
+def test_poll_reports_only_changes():
+    provider = FakeProvider()
+    watcher = netconn.ConnectionWatcher(resolver=FakeResolver(), provider=provider,
+                                        process_cache=netconn.ProcessCache())
+    pid = os.getpid()
+    
+    provider.rows = [row(1000, "MIB_TCP_STATE_ESTAB"), row(1001, "MIB_TCP_STATE_ESTAB")]
+    events = watcher.poll()
+    assert summary(events) == [
+        ("new", "10.0.0.1:1000", "MIB_TCP_STATE_ESTAB", None, pid),
+        ("new", "10.0.0.1:1001", "MIB_TCP_STATE_ESTAB", None, pid),
+    ]
+    assert events[0]["dst_name"] == "host-10.0.0.2"
+    
+    assert watcher.poll() == []
+    
+    provider.rows = [row(1000, "MIB_TCP_STATE_CLOSE_WAIT"), row(1001, "MIB_TCP_STATE_ESTAB")]
+    assert summary(watcher.poll()) == [
+        ("changed", "10.0.0.1:1000", "MIB_TCP_STATE_CLOSE_WAIT", "MIB_TCP_STATE_ESTAB", pid),
+    ]
+    
+    # the owner goes away: closed, without the stale previous_state, then new
+    provider.rows = [row(1000, "MIB_TCP_STATE_CLOSE_WAIT", pid=0), row(1001, "MIB_TCP_STATE_ESTAB")]
+    assert summary(watcher.poll()) == [
+        ("closed", "10.0.0.1:1000", "MIB_TCP_STATE_CLOSE_WAIT", None, pid),
+        ("new", "10.0.0.1:1000", "MIB_TCP_STATE_CLOSE_WAIT", None, 0),
+    ]
+    
+    provider.rows = []
+    assert [e["event"] for e in watcher.poll()] == ["closed", "closed"]